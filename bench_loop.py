@@ -0,0 +1,145 @@
+"""
+Сравнение пропускной способности обработки апдейтов на разных циклах событий.
+
+    python bench_loop.py --updates 20000 --concurrency 200
+
+dispatch - апдейты подаются прямо в Dispatcher (маршрутизация, фильтры, middleware);
+webhook  - полный путь через aiohttp: HTTP-запрос -> обработчик вебхука -> Dispatcher.
+Хендлер не ходит в сеть и БД, поэтому разница между строками - это накладные расходы цикла
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+from aiohttp import web, ClientSession, TCPConnector
+from aiogram import Bot, Dispatcher, F
+from aiogram.types import Update
+
+from services.webhook import LimitedRequestHandler
+
+TOKEN = "123456:BENCHMARK"
+
+# Лог каждого апдейта в консоль измерял бы скорость терминала, а не цикла
+logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+
+
+def build_dispatcher(counter: dict) -> Dispatcher:
+    dp = Dispatcher()
+
+    @dp.update.outer_middleware()
+    async def noop_middleware(handler, event, data):
+        return await handler(event, data)
+
+    @dp.message(F.text == "❓ FAQ")
+    async def faq(message):
+        counter["handled"] += 1
+        await asyncio.sleep(0)
+
+    @dp.message()
+    async def fallback(message):
+        counter["handled"] += 1
+
+    return dp
+
+
+def make_update(update_id: int) -> dict:
+    user_id = 100000 + update_id % 1000
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Bench"},
+            "text": "❓ FAQ" if update_id % 2 else "hello"
+        }
+    }
+
+
+async def bench_dispatch(updates: int, concurrency: int) -> float:
+    counter = {"handled": 0}
+    dp = build_dispatcher(counter)
+    bot = Bot(TOKEN)
+    payloads = [Update.model_validate(make_update(i), context={"bot": bot}) for i in range(updates)]
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def feed(update):
+        async with semaphore:
+            await dp.feed_update(bot, update)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(feed(u) for u in payloads))
+    elapsed = time.perf_counter() - started
+    await bot.session.close()
+    assert counter["handled"] == updates
+    return updates / elapsed
+
+
+async def bench_webhook(updates: int, concurrency: int, port: int) -> float:
+    counter = {"handled": 0}
+    dp = build_dispatcher(counter)
+    bot = Bot(TOKEN)
+    app = web.Application()
+    handler = LimitedRequestHandler(dp, bot, max_concurrency=concurrency, max_pending=updates)
+    handler.register(app, path="/webhook")
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+
+    queue = asyncio.Queue()
+    for i in range(updates):
+        queue.put_nowait(make_update(i))
+
+    async def client(session):
+        while not queue.empty():
+            async with session.post(f"http://127.0.0.1:{port}/webhook", json=queue.get_nowait()) as response:
+                await response.read()
+
+    started = time.perf_counter()
+    async with ClientSession(connector=TCPConnector(limit=concurrency)) as session:
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+    await handler.drain()
+    elapsed = time.perf_counter() - started
+
+    await runner.cleanup()
+    await bot.session.close()
+    assert counter["handled"] == updates
+    return updates / elapsed
+
+
+def loop_factories():
+    factories = {"asyncio": asyncio.new_event_loop}
+    try:
+        import uvloop
+        factories["uvloop"] = uvloop.new_event_loop
+    except ImportError:
+        print("⚠️ uvloop не установлен - сравнивается только стандартный цикл")
+    return factories
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк циклов событий")
+    parser.add_argument("--updates", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--rounds", type=int, default=3, help="лучший результат из N прогонов")
+    args = parser.parse_args()
+
+    print(f"{'цикл':<10}{'dispatch, апд/с':>18}{'webhook, апд/с':>18}")
+    for name, factory in loop_factories().items():
+        results = []
+        for bench in (
+            lambda: bench_dispatch(args.updates, args.concurrency),
+            lambda: bench_webhook(args.updates // 4, args.concurrency, args.port)
+        ):
+            best = 0.0
+            for _ in range(args.rounds):
+                with asyncio.Runner(loop_factory=factory) as runner:
+                    best = max(best, runner.run(bench()))
+            results.append(best)
+        print(f"{name:<10}{results[0]:>18.0f}{results[1]:>18.0f}")
+
+
+if __name__ == "__main__":
+    main()
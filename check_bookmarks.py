@@ -0,0 +1,114 @@
+"""
+Проверка постраничного вывода закладок (handlers/menu.py, build_bookmarks_page).
+
+Запускать на отдельной пустой БД - скрипт создаёт пользователя и закладки:
+    DATABASE_URL=sqlite+aiosqlite:///bookmarks_check.db python check_bookmarks.py --bookmarks 23
+
+Что проверяется:
+1. Проход вперёд (➡️) по всем страницам показывает каждую закладку ровно
+   один раз, от новых к старым - в том числе закладки с одинаковым
+   временем добавления (порядок между ними задаёт id).
+2. Проход назад (⬅️) с последней страницы возвращает те же страницы.
+"""
+import argparse
+import asyncio
+import sys
+from datetime import datetime
+from sqlalchemy import select, func
+
+from database import engine, Base, AsyncSessionLocal
+from handlers.menu import build_bookmarks_page
+from models import User, Bookmark
+
+TG_ID = 7_200_000_000
+
+
+def check(ok: bool, title: str) -> bool:
+    print(f"{'✅' if ok else '❌'} {title}")
+    return ok
+
+
+def parse_page(page):
+    """Материалы страницы и курсоры стрелок из клавиатуры"""
+    _, keyboard = page
+    materials, prev_cb, next_cb = [], None, None
+    for row in keyboard.inline_keyboard:
+        for button in row:
+            data = button.callback_data
+            if data.startswith("open_"):
+                materials.append(int(data.split("_", 1)[1]))
+            elif data.startswith("bm_before_"):
+                prev_cb = data[len("bm_before_"):]
+            elif data.startswith("bm_after_"):
+                next_cb = data[len("bm_after_"):]
+    return materials, prev_cb, next_cb
+
+
+async def run_check(count: int) -> bool:
+    engine.echo = False
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    async with AsyncSessionLocal() as db:
+        if await db.scalar(select(func.count(User.id))):
+            print("❌ В БД уже есть пользователи - запустите проверку на отдельной пустой БД")
+            return False
+        user = User(tg_id=TG_ID, name="User")
+        db.add(user)
+        await db.flush()
+        # Первая половина - с одинаковым временем добавления, вторая - со значением по умолчанию
+        same_time = datetime.utcnow().replace(microsecond=0)
+        for material_id in range(1, count + 1):
+            bookmark = Bookmark(user_id=user.id, material_id=material_id, subcategory_id=1, material_name=f"Урок {material_id}")
+            if material_id <= count // 2:
+                bookmark.added_at = same_time
+            db.add(bookmark)
+            await db.flush()
+        await db.commit()
+
+        expected = await db.execute(
+            select(Bookmark.material_id)
+            .where(Bookmark.user_id == user.id)
+            .order_by(Bookmark.added_at.desc(), Bookmark.id.desc())
+        )
+        expected = expected.scalars().all()
+
+    results = []
+    async with AsyncSessionLocal() as db:
+        pages = []
+        cursor = None
+        while True:
+            materials, prev_cb, next_cb = parse_page(await build_bookmarks_page(db, TG_ID, after=cursor))
+            pages.append(materials)
+            if not next_cb or len(pages) > count:
+                break
+            cursor = next_cb
+        seen = [material_id for page in pages for material_id in page]
+        results.append(check(
+            len(seen) == len(set(seen)) == count,
+            f"Вперёд: {len(pages)} стр., показано {len(seen)}, уникальных {len(set(seen))} из {count}"
+        ))
+        results.append(check(seen == expected, "Порядок - от новых к старым, при равном времени - по id"))
+
+        # Назад - от последней страницы по её стрелке ⬅️
+        back = [pages[-1]]
+        while prev_cb and len(back) <= count:
+            materials, prev_cb, _ = parse_page(await build_bookmarks_page(db, TG_ID, before=prev_cb))
+            back.append(materials)
+        back.reverse()
+        results.append(check(back == pages, f"Назад: {len(back)} стр., совпадают со страницами вперёд"))
+
+    return all(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Проверка страниц закладок")
+    parser.add_argument("--bookmarks", type=int, default=23, help="сколько закладок создать")
+    args = parser.parse_args()
+
+    ok = asyncio.run(run_check(args.bookmarks))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Проверка движка рассылок на поддельном Bot API (services/broadcast.py).
+
+Запускать на отдельной пустой БД - скрипт создаёт пользователей и рассылку:
+    DATABASE_URL=sqlite+aiosqlite:///broadcast_check.db python check_broadcast.py --users 1200
+
+Что проверяется:
+1. Режим копирования: рассылка публикуется в служебный чат один раз,
+   получателям уходит copyMessage.
+2. Возобновление: рассылка прерывается после первой пачки, её аренда
+   истекает, и она продолжается с сохранённого курсора - каждый
+   получатель получает сообщение ровно один раз.
+3. Захват: пока аренда действует, другой процесс рассылку не забирает,
+   а параллельные resume_broadcasts не запускают её дважды.
+"""
+import argparse
+import asyncio
+import logging
+import sys
+from collections import Counter
+from datetime import datetime, timedelta
+from aiohttp import web
+from aiogram import Bot
+from aiogram.client.telegram import TelegramAPIServer
+from sqlalchemy import select, func, update
+
+import services.broadcast as broadcasts
+from database import engine, Base, AsyncSessionLocal
+from loadtest_webhook import fake_api_app
+from models import User, Broadcast
+from services.outbound import RateLimitedSession
+
+STAGING_CHAT_ID = 1
+FIRST_TG_ID = 7_000_000_000
+
+
+def check(ok: bool, title: str) -> bool:
+    print(f"{'✅' if ok else '❌'} {title}")
+    return ok
+
+
+async def run_check(users: int, batch_size: int) -> bool:
+    engine.echo = False
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    async with AsyncSessionLocal() as db:
+        if await db.scalar(select(func.count(User.id))):
+            print("❌ В БД уже есть пользователи - запустите проверку на отдельной пустой БД")
+            return False
+        db.add_all([User(tg_id=FIRST_TG_ID + i, name=f"User{i}") for i in range(users)])
+        await db.commit()
+
+    calls = []
+    runner = web.AppRunner(fake_api_app(calls))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    bot = Bot(
+        token="1:check",
+        session=RateLimitedSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{port}"))
+    )
+    broadcasts.BATCH_SIZE = batch_size
+    results = []
+
+    try:
+        # 1. Публикация в служебный чат (режим копирования)
+        async with AsyncSessionLocal() as db:
+            broadcast = Broadcast(
+                name="Проверка", description="copy + resume", content_type="text",
+                content={"text": "Проверка рассылки"}, mode=broadcasts.MODE_COPY, status="running"
+            )
+            db.add(broadcast)
+            await broadcasts.stage_broadcast(bot, broadcast, STAGING_CHAT_ID)
+            await db.commit()
+            broadcast_id = broadcast.id
+
+        # 2. Прерываем после первой пачки - как если бы процесс упал
+        first_batch = asyncio.Event()
+
+        async def on_progress(sent: int, failed: int):
+            first_batch.set()
+            await asyncio.sleep(3600)
+
+        task = asyncio.create_task(broadcasts.run_broadcast(bot, broadcast_id, on_progress=on_progress))
+        await first_batch.wait()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+        async with AsyncSessionLocal() as db:
+            interrupted = await db.get(Broadcast, broadcast_id)
+            results.append(check(
+                interrupted.status == "running" and interrupted.sent_count == batch_size,
+                f"Прервана после первой пачки: отправлено {interrupted.sent_count} из {users}"
+            ))
+
+            # 3. Аренда упавшего процесса ещё действует - другой процесс рассылку не забирает
+            own_owner, broadcasts.OWNER = broadcasts.OWNER, "another-replica"
+            results.append(check(
+                not await broadcasts.claim_broadcast(db, broadcast_id),
+                "Другой процесс не забирает рассылку с действующей арендой"
+            ))
+            broadcasts.OWNER = own_owner
+
+            # Аренда истекла - рассылку подхватывает "новый" процесс
+            await db.execute(
+                update(Broadcast)
+                .where(Broadcast.id == broadcast_id)
+                .values(lease_expires_at=datetime.utcnow() - timedelta(seconds=1))
+            )
+            await db.commit()
+        broadcasts.OWNER = "restarted-process"
+
+        await asyncio.gather(broadcasts.resume_broadcasts(bot), broadcasts.resume_broadcasts(bot))
+        outcomes = await asyncio.gather(*broadcasts._background_tasks)
+        runs = sum(1 for outcome in outcomes if outcome is not None)
+        results.append(check(runs == 1, f"Параллельные resume_broadcasts провели рассылку {runs} раз(а)"))
+
+        async with AsyncSessionLocal() as db:
+            finished = await db.get(Broadcast, broadcast_id)
+            results.append(check(
+                finished.status == "done" and finished.sent_count == users and not finished.failed_count,
+                f"Завершена: статус {finished.status}, отправлено {finished.sent_count}, ошибок {finished.failed_count}"
+            ))
+
+        methods = Counter(method for method, _ in calls)
+        copies = Counter(chat_id for method, chat_id in calls if method == "copymessage")
+        expected = {str(FIRST_TG_ID + i) for i in range(users)}
+        results.append(check(
+            methods["sendmessage"] == 1 and [chat_id for method, chat_id in calls if method == "sendmessage"] == [str(STAGING_CHAT_ID)],
+            f"Сообщение опубликовано в служебный чат один раз (sendMessage: {methods['sendmessage']})"
+        ))
+        results.append(check(
+            set(copies) == expected and max(copies.values()) == 1,
+            f"copyMessage: {sum(copies.values())} вызовов, {len(copies)} получателей, повторов {sum(copies.values()) - len(copies)}"
+        ))
+    finally:
+        await bot.session.close()
+        await runner.cleanup()
+
+    return all(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Проверка рассылок на поддельном Bot API")
+    parser.add_argument("--users", type=int, default=1200, help="сколько получателей создать")
+    parser.add_argument("--batch-size", type=int, default=500, help="размер пачки рассылки")
+    args = parser.parse_args()
+
+    logging.getLogger("services.outbound").setLevel(logging.WARNING)
+    ok = asyncio.run(run_check(args.users, args.batch_size))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Проверка FSM-хранилищ (utils/fsm_storage.py): SQLStorage и кэша CachedStorage.
+
+Запускать на отдельной БД - скрипт пишет в таблицу fsm_states:
+    DATABASE_URL=sqlite+aiosqlite:///fsm_check.db python check_fsm_storage.py
+
+Что проверяется:
+1. SQLStorage: состояние и данные сохраняются, перезаписываются и
+   читаются; для нового ключа - None и пустой словарь.
+2. Сквозная запись: запись через кэш сразу попадает в хранилище, а
+   следующее чтение обслуживается кэшем без запроса к БД.
+3. TTL: изменение "из другой реплики" видно только после истечения записи кэша.
+4. LRU: при переполнении вытесняется давно не использованный ключ.
+"""
+import argparse
+import asyncio
+import sys
+from aiogram.fsm.storage.base import StorageKey
+from sqlalchemy import delete
+
+from database import engine, Base, AsyncSessionLocal
+from models import FSMRecord
+from utils.fsm_storage import SQLStorage, CachedStorage
+
+BOT_ID = 1
+FIRST_USER_ID = 7_300_000_000
+
+
+def check(ok: bool, title: str) -> bool:
+    print(f"{'✅' if ok else '❌'} {title}")
+    return ok
+
+
+def make_key(n: int) -> StorageKey:
+    user_id = FIRST_USER_ID + n
+    return StorageKey(bot_id=BOT_ID, chat_id=user_id, user_id=user_id)
+
+
+class CountingStorage(SQLStorage):
+    """SQLStorage, который считает чтения из БД"""
+
+    def __init__(self):
+        super().__init__()
+        self.reads = 0
+
+    async def get_state(self, key):
+        self.reads += 1
+        return await super().get_state(key)
+
+    async def get_data(self, key):
+        self.reads += 1
+        return await super().get_data(key)
+
+
+async def run_check(ttl: float) -> bool:
+    engine.echo = False
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(FSMRecord).where(FSMRecord.key.like(f"fsm:{BOT_ID}:%")))
+        await db.commit()
+
+    results = []
+
+    # 1. SQLStorage
+    sql = SQLStorage()
+    key = make_key(0)
+    empty = (await sql.get_state(key), await sql.get_data(key))
+    await sql.set_state(key, "Form:name")
+    await sql.set_data(key, {"name": "Анна"})
+    await sql.set_data(key, {"name": "Анна", "age": 20})
+    stored = (await sql.get_state(key), await sql.get_data(key))
+    await sql.set_state(key, None)
+    results.append(check(
+        empty == (None, {}) and stored == ("Form:name", {"name": "Анна", "age": 20}) and await sql.get_state(key) is None,
+        f"SQLStorage: новый ключ {empty}, после записи {stored}"
+    ))
+
+    # 2. Сквозная запись
+    backend = CountingStorage()
+    cached = CachedStorage(backend, size=2, ttl=ttl)
+    key = make_key(1)
+    await cached.set_state(key, "Form:age")
+    await cached.set_data(key, {"step": 1})
+    in_backend = (await sql.get_state(key), await sql.get_data(key))
+    data = await cached.get_data(key)
+    data["step"] = 99  # изменения копии не должны попасть в кэш
+    from_cache = (await cached.get_state(key), await cached.get_data(key))
+    results.append(check(
+        in_backend == ("Form:age", {"step": 1}) and from_cache == in_backend and backend.reads == 0,
+        f"Сквозная запись: в БД {in_backend}, из кэша {from_cache}, чтений БД {backend.reads}"
+    ))
+
+    # 3. TTL: другая реплика меняет данные в обход этого кэша
+    await sql.set_data(key, {"step": 2})
+    stale = await cached.get_data(key)
+    await asyncio.sleep(ttl + 0.05)
+    fresh = await cached.get_data(key)
+    results.append(check(
+        stale == {"step": 1} and fresh == {"step": 2} and backend.reads == 1,
+        f"TTL {ttl:g} с: до истечения {stale}, после {fresh}"
+    ))
+
+    # 4. LRU: ключ 1 недавно читали, поэтому при добавлении ключа 3 вытесняется ключ 2
+    await cached.set_data(make_key(2), {"n": 2})
+    await cached.get_data(key)
+    await cached.set_data(make_key(3), {"n": 3})
+    reads = backend.reads
+    await cached.get_data(key)
+    kept = backend.reads == reads
+    evicted = await cached.get_data(make_key(2))
+    results.append(check(
+        kept and backend.reads == reads + 1 and evicted == {"n": 2} and len(cached._cache) == 2,
+        f"LRU на 2 ключа: недавний ключ остался в кэше, вытесненный прочитан из БД ({evicted})"
+    ))
+
+    await cached.close()
+    return all(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Проверка FSM-хранилищ")
+    parser.add_argument("--ttl", type=float, default=0.5, help="время жизни записи кэша в проверке (секунды)")
+    args = parser.parse_args()
+
+    ok = asyncio.run(run_check(args.ttl))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Проверка проверки подписки (middlewares/subscription.py) под нагрузкой
+на поддельном Bot API: N разных пользователей одновременно проходят
+SubscriptionMiddleware через RateLimitedSession.
+
+Запускать на отдельной пустой БД - скрипт создаёт пользователей и спонсора:
+    DATABASE_URL=sqlite+aiosqlite:///subscription_check.db python check_subscription.py --users 30
+
+Что проверяется:
+1. Все апдейты доходят до хендлера.
+2. getChatMember разных пользователей к одному каналу не упирается в лимит
+   одного чата (OUTBOUND_CHAT_RATE_PER_SECOND) - только в общий лимит.
+3. Сообщения в один чат по-прежнему ограничиваются лимитом чата.
+"""
+import argparse
+import asyncio
+import sys
+import time
+from datetime import datetime
+from collections import Counter
+from aiohttp import web
+from aiogram import Bot
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import Chat, Message, User as TgUser
+from sqlalchemy import select, func
+
+from database import engine, Base, AsyncSessionLocal
+from loadtest_webhook import fake_api_app
+from middlewares.subscription import SubscriptionMiddleware
+from models import User, Sponsor
+from services.outbound import RateLimitedSession, OutboundLimiter
+
+FIRST_TG_ID = 7_100_000_000
+
+
+def check(ok: bool, title: str) -> bool:
+    print(f"{'✅' if ok else '❌'} {title}")
+    return ok
+
+
+def make_message(user_id: int) -> Message:
+    return Message(
+        message_id=1,
+        date=datetime.now(),
+        chat=Chat(id=user_id, type="private"),
+        from_user=TgUser(id=user_id, is_bot=False, first_name="User"),
+        text="ℹ️ О боте"
+    )
+
+
+async def run_check(users: int, rate: float) -> bool:
+    engine.echo = False
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    async with AsyncSessionLocal() as db:
+        if await db.scalar(select(func.count(User.id))):
+            print("❌ В БД уже есть пользователи - запустите проверку на отдельной пустой БД")
+            return False
+        db.add_all([User(tg_id=FIRST_TG_ID + i, name=f"User{i}", is_subscribed=True) for i in range(users)])
+        db.add(Sponsor(name="Спонсор", url="https://t.me/check_sponsor"))
+        await db.commit()
+
+    calls = []
+    runner = web.AppRunner(fake_api_app(calls))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    limiter = OutboundLimiter(rate=rate, chat_rate=1, chat_burst=3)
+    bot = Bot(
+        token="1:check",
+        session=RateLimitedSession(limiter=limiter, api=TelegramAPIServer.from_base(f"http://127.0.0.1:{port}"))
+    )
+    results = []
+
+    try:
+        middleware = SubscriptionMiddleware()
+        handled = []
+
+        async def handler(event, data):
+            handled.append(event.from_user.id)
+
+        started = time.monotonic()
+        await asyncio.gather(*(
+            middleware(handler, make_message(FIRST_TG_ID + i), {"bot": bot})
+            for i in range(users)
+        ))
+        elapsed = time.monotonic() - started
+        checks = Counter(method for method, _ in calls)["getchatmember"]
+
+        results.append(check(
+            len(handled) == users and checks == users,
+            f"Обработано апдейтов: {len(handled)} из {users}, getChatMember: {checks}"
+        ))
+        # Общий лимит допускает rate запросов подряд, дальше - rate в секунду
+        budget = max(0.0, (users - rate) / rate) + 1.0
+        results.append(check(
+            elapsed < budget,
+            f"Проверка {users} пользователей заняла {elapsed:.2f} с (допустимо < {budget:.2f} с)"
+        ))
+
+        started = time.monotonic()
+        for _ in range(5):
+            await bot.send_message(FIRST_TG_ID, "x")
+        elapsed = time.monotonic() - started
+        results.append(check(
+            elapsed >= 1.5,
+            f"5 сообщений в один чат - {elapsed:.2f} с (лимит чата 1/с после 3 подряд)"
+        ))
+    finally:
+        await bot.session.close()
+        await runner.cleanup()
+
+    return all(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Проверка подписки на поддельном Bot API")
+    parser.add_argument("--users", type=int, default=30, help="сколько пользователей проверять одновременно")
+    parser.add_argument("--rate", type=float, default=30, help="общий лимит запросов в секунду")
+    args = parser.parse_args()
+
+    ok = asyncio.run(run_check(args.users, args.rate))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@ from sqlalchemy.orm import sessionmaker, declarative_base
 from sqlalchemy import text
 from config import Config
 import logging
+import os
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -26,6 +27,42 @@ async def get_db():
     async with AsyncSessionLocal() as session:
         yield session
 
+def dialect_insert(table):
+    """INSERT с поддержкой ON CONFLICT для текущей СУБД (PostgreSQL/SQLite)"""
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table)
+
+def check_schema_revision(conn, fresh: bool):
+    """
+    Сверяет ревизию схемы с миграциями (alembic.ini). Новую БД create_all
+    создаёт сразу актуальной - её помечаем последней ревизией; существующую
+    без нужной ревизии не запускаем: create_all не добавит в её таблицы
+    новые столбцы и ограничения, и бот упадёт уже на запросах
+    """
+    from alembic.config import Config as AlembicConfig
+    from alembic.runtime.migration import MigrationContext
+    from alembic.script import ScriptDirectory
+
+    script = ScriptDirectory.from_config(
+        AlembicConfig(os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini"))
+    )
+    head = script.get_current_head()
+    context = MigrationContext.configure(conn)
+    current = context.get_current_revision()
+    if current == head:
+        return
+    if fresh:
+        context.stamp(script, head)
+        logger.info(f"✅ Новая БД помечена ревизией схемы {head}")
+        return
+    raise RuntimeError(
+        f"Схема БД устарела (ревизия {current or 'нет'}, нужна {head}). "
+        f"Выполните `alembic upgrade head` - см. раздел README «Обновление существующей БД»"
+    )
+
 async def check_connection():
     try:
         async with engine.connect() as conn:
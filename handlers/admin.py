@@ -17,13 +17,16 @@ from keyboards import (
     get_content_type_keyboard,
     get_confirm_keyboard_admin,
     get_sponsors_inline,
-    get_broadcast_keyboard
+    get_broadcast_confirm_keyboard
 )
 from database import get_db
 from models import User, Sponsor, Broadcast, UserProgress, Bookmark
-from config import Config
+from middlewares.admin_mode import ADMIN_IDS, _admin_mode_keys
 from utils.json_db import json_db
 from utils.helpers import is_valid_url
+from services.stats import collect_admin_stats
+from services.activity import get_activity_report
+from services.broadcast import run_broadcast, stage_broadcast, start_in_background, MODE_SEND, MODE_COPY
 import logging
 
 logger = logging.getLogger(__name__)
@@ -64,13 +67,20 @@ class AdminStates(StatesGroup):
     waiting_broadcast_confirm = State()
 
 def is_admin(user_id: int) -> bool:
-    return user_id in Config.ADMIN_IDS
+    return user_id in ADMIN_IDS
 
 async def ensure_admin_mode(state: FSMContext, message: Message) -> bool:
-    """Проверяет и восстанавливает админ-режим"""
+    """
+    Проверяет и восстанавливает админ-режим.
+    Если AdminModeMiddleware уже записал флаг для этого админа в текущем
+    процессе, хранилище не читаем
+    """
+    if state.key in _admin_mode_keys:
+        return True
     data = await state.get_data()
     if not data.get('is_admin_mode', False):
         await state.set_data({"is_admin_mode": True})
+        _admin_mode_keys.add(state.key)
         await message.answer(
             "⚠️ Сессия администратора восстановлена.",
             reply_markup=get_admin_reply_keyboard()
@@ -727,69 +737,26 @@ async def admin_stats(message: Message, state: FSMContext):
     
     async for db in get_db():
         try:
-            # Основная статистика из PostgreSQL
-            users_count = await db.execute(select(func.count(User.id)))
-            users_count = users_count.scalar() or 0
-            
-            today = datetime.now().date()
-            today_users = await db.execute(
-                select(func.count(User.id)).where(func.date(User.last_active) == today)
-            )
-            today_users = today_users.scalar() or 0
-            
-            week_ago = datetime.now() - timedelta(days=7)
-            week_users = await db.execute(
-                select(func.count(User.id)).where(User.last_active >= week_ago)
-            )
-            week_users = week_users.scalar() or 0
-            
-            sponsors_count = await db.execute(select(func.count(Sponsor.id)))
-            sponsors_count = sponsors_count.scalar() or 0
-            
-            broadcasts_count = await db.execute(select(func.count(Broadcast.id)))
-            broadcasts_count = broadcasts_count.scalar() or 0
-            
-            # Статистика из JSON
-            categories = json_db.get_categories()
-            categories_count = len(categories)
-            
-            subcategories_count = 0
-            for cat in categories:
-                subcategories_count += len(json_db.get_subcategories(cat['id']))
-            
-            materials_count = len(json_db.get_materials())
-            
-            # Активные ученики (уникальные пользователи, у которых есть прогресс)
-            active_learners = await db.execute(
-                select(func.count(func.distinct(UserProgress.user_id)))
-            )
-            active_learners = active_learners.scalar() or 0
-            
-            # Общее количество закладок
-            bookmarks_count = await db.execute(select(func.count(Bookmark.id)))
-            bookmarks_count = bookmarks_count.scalar() or 0
-            
-            # Средний XP на пользователя
-            avg_xp = await db.execute(select(func.avg(User.xp)))
-            avg_xp = avg_xp.scalar() or 0
+            stats = await collect_admin_stats(db)
             
             stats_text = (
                 f"📊 **СТАТИСТИКА БОТА**\n\n"
                 f"👥 **Пользователи (PostgreSQL):**\n"
-                f"• Всего: {users_count}\n"
-                f"• Активных сегодня: {today_users}\n"
-                f"• Активных за неделю: {week_users}\n"
-                f"• Средний XP: {avg_xp:.1f}\n\n"
+                f"• Всего: {stats['users']}\n"
+                f"• Активных сегодня: {stats['today_users']}\n"
+                f"• Активных за неделю: {stats['week_users']}\n"
+                f"• Средний XP: {stats['avg_xp']:.1f}\n\n"
                 
                 f"📚 **Контент (JSON):**\n"
-                f"• Категорий: {categories_count}\n"
-                f"• Подкатегорий: {subcategories_count}\n"
-                f"• Материалов: {materials_count}\n"
-                f"• Активных учеников: {active_learners}\n"
-                f"• Закладок: {bookmarks_count}\n\n"
+                f"• Категорий: {stats['categories']}\n"
+                f"• Подкатегорий: {stats['subcategories']}\n"
+                f"• Материалов: {stats['materials']}\n"
+                f"• Активных учеников: {stats['active_learners']}\n"
+                f"• Закладок: {stats['bookmarks']}\n\n"
                 
-                f"🔗 **Спонсоров:** {sponsors_count}\n"
-                f"📨 **Рассылок:** {broadcasts_count}\n\n"
+                f"🔗 **Спонсоров:** {stats['sponsors']}\n"
+                f"📨 **Рассылок:** {stats['broadcasts']}\n\n"
+                f"ℹ️ Всего пользователей, средний XP, ученики и закладки обновляются раз в час\n"
                 f"📅 **Дата:** {datetime.now().strftime('%d.%m.%Y %H:%M')}"
             )
             
@@ -807,6 +774,53 @@ async def admin_stats(message: Message, state: FSMContext):
             )
         break
 
+# ---------- АКТИВНОСТЬ ----------
+@router.message(F.text == "📈 Активность")
+async def admin_activity(message: Message, state: FSMContext):
+    """DAU/WAU/MAU и удержание когорт из готовых свёрток"""
+    if not is_admin(message.from_user.id):
+        return
+    
+    if not await ensure_admin_mode(state, message):
+        return
+    
+    async for db in get_db():
+        report = await get_activity_report(db)
+        rollups = report["rollups"]
+        
+        if not rollups:
+            await message.answer(
+                "📈 Данных об активности пока нет - свёртка считается раз в час.",
+                reply_markup=get_admin_reply_keyboard()
+            )
+            return
+        
+        latest = rollups[0]
+        stickiness = latest.dau / latest.mau * 100 if latest.mau else 0
+        text = (
+            f"📈 **АКТИВНОСТЬ** ({latest.day.strftime('%d.%m.%Y')})\n\n"
+            f"• DAU: {latest.dau}\n"
+            f"• WAU: {latest.wau}\n"
+            f"• MAU: {latest.mau}\n"
+            f"• DAU/MAU: {stickiness:.1f}%\n\n"
+            f"📅 **По дням:**\n"
+        )
+        for r in rollups:
+            text += f"{r.day.strftime('%d.%m')}: {r.dau} активных, {r.new_users} новых\n"
+        
+        if report["retention"]:
+            text += "\n🔁 **Удержание по неделям регистрации:**\n"
+            for cohort_week, weeks in report["retention"].items():
+                cohort_size = max(size for _, size in weeks.values())
+                cells = " ".join(
+                    f"{active / size * 100:.0f}%" if size else "-"
+                    for _, (active, size) in sorted(weeks.items())
+                )
+                text += f"{cohort_week.strftime('%d.%m')} ({cohort_size}): {cells}\n"
+        
+        await message.answer(text, reply_markup=get_admin_reply_keyboard())
+        break
+
 # ---------- ТОП-10 ----------
 @router.message(F.text == "🏆 ТОП-10 (админ)")
 async def admin_top10(message: Message, state: FSMContext):
@@ -1000,94 +1014,89 @@ async def admin_broadcast_confirm(message: Message, state: FSMContext):
     
     preview += "\nОтправить всем пользователям?"
     
-    await message.answer(preview, reply_markup=get_confirm_keyboard_admin("broadcast"))
+    await message.answer(preview, reply_markup=get_broadcast_confirm_keyboard(data['broadcast_content_type']))
     await state.set_state(AdminStates.waiting_broadcast_confirm)
 
-@router.callback_query(AdminStates.waiting_broadcast_confirm, F.data == "confirm_broadcast")
+@router.callback_query(AdminStates.waiting_broadcast_confirm, F.data.in_({"confirm_broadcast", "confirm_broadcast_copy"}))
 async def admin_broadcast_send(callback: CallbackQuery, state: FSMContext):
     if not is_admin(callback.from_user.id):
         return
     
     data = await state.get_data()
+    mode = MODE_COPY if callback.data == "confirm_broadcast_copy" else MODE_SEND
     await callback.message.edit_text("📨 Рассылка началась...")
     
     async for db in get_db():
-        users = await db.execute(select(User))
-        users = users.scalars().all()
-        
-        # Сохраняем рассылку в БД
+        # Сохраняем рассылку в БД - по ней движок возобновит отправку после перезапуска
         broadcast = Broadcast(
             name=data['broadcast_name'],
             description=data.get('broadcast_description'),
             content_type=data['broadcast_content_type'],
             content=data['broadcast_content'],
             button_text=data.get('button_text'),
-            button_url=data.get('button_url')
+            button_url=data.get('button_url'),
+            mode=mode,
+            status="running"
         )
         db.add(broadcast)
-        await db.commit()
-        
-        sent = 0
-        failed = 0
-        broadcast_name = data['broadcast_name']
-        broadcast_desc = data.get('broadcast_description', '')
         
-        for user in users:
+        if mode == MODE_COPY:
             try:
-                if data['broadcast_content_type'] == "text":
-                    text = data['broadcast_content']['text']
-                    full_text = f"📢 <b>{broadcast_name}</b>\n\n{broadcast_desc}\n\n{text}"
-                    await callback.bot.send_message(
-                        user.tg_id, 
-                        full_text, 
-                        parse_mode="HTML", 
-                        reply_markup=get_broadcast_keyboard(data) if data.get('button_text') else None
-                    )
-                elif data['broadcast_content_type'] == "photo":
-                    caption = f"📢 <b>{broadcast_name}</b>\n\n{broadcast_desc}"
-                    await callback.bot.send_photo(
-                        user.tg_id, 
-                        data['broadcast_content']['file_id'], 
-                        caption=caption, 
-                        parse_mode="HTML", 
-                        reply_markup=get_broadcast_keyboard(data) if data.get('button_text') else None
-                    )
-                elif data['broadcast_content_type'] == "video":
-                    caption = f"📢 <b>{broadcast_name}</b>\n\n{broadcast_desc}"
-                    await callback.bot.send_video(
-                        user.tg_id, 
-                        data['broadcast_content']['file_id'], 
-                        caption=caption, 
-                        parse_mode="HTML", 
-                        reply_markup=get_broadcast_keyboard(data) if data.get('button_text') else None
-                    )
-                elif data['broadcast_content_type'] == "document":
-                    caption = f"📢 <b>{broadcast_name}</b>\n\n{broadcast_desc}"
-                    await callback.bot.send_document(
-                        user.tg_id, 
-                        data['broadcast_content']['file_id'], 
-                        caption=caption, 
-                        parse_mode="HTML", 
-                        reply_markup=get_broadcast_keyboard(data) if data.get('button_text') else None
-                    )
-                sent += 1
-                await asyncio.sleep(0.05)  # Защита от флуда
+                await stage_broadcast(callback.bot, broadcast, callback.message.chat.id)
             except Exception as e:
-                failed += 1
-                logger.error(f"Ошибка отправки пользователю {user.tg_id}: {e}")
+                logger.error(f"Ошибка публикации рассылки в служебный чат: {e}")
+                await callback.message.answer(
+                    f"❌ Не удалось опубликовать рассылку в служебный чат: {e}",
+                    reply_markup=get_admin_reply_keyboard()
+                )
+                await state.clear()
+                await state.set_data({"is_admin_mode": True})
+                await callback.answer()
+                return
         
-        await callback.message.answer(
-            f"✅ Рассылка завершена!\n\n"
-            f"📨 Отправлено: {sent}\n"
-            f"❌ Ошибок: {failed}",
-            reply_markup=get_admin_reply_keyboard()
-        )
+        await db.commit()
+        broadcast_id = broadcast.id
         break
     
+    # Рассылка идёт в фоне: админ не ждёт её окончания, прогресс обновляется в сообщении
+    start_in_background(_broadcast_with_progress(callback.bot, callback.message, broadcast_id))
+    
+    await callback.message.answer(
+        "📨 Рассылка запущена в фоне. Прогресс - в сообщении выше.",
+        reply_markup=get_admin_reply_keyboard()
+    )
+    
     await state.clear()
     await state.set_data({"is_admin_mode": True})
     await callback.answer()
 
+async def _broadcast_with_progress(bot, status_message: Message, broadcast_id: int):
+    """Проводит рассылку и показывает её ход в сообщении администратора"""
+    async def report(sent: int, failed: int):
+        await status_message.edit_text(
+            f"📨 Рассылка идёт...\n\n"
+            f"📨 Отправлено: {sent}\n"
+            f"❌ Ошибок: {failed}"
+        )
+    
+    try:
+        result = await run_broadcast(bot, broadcast_id, on_progress=report)
+    except Exception as e:
+        logger.error(f"Ошибка рассылки {broadcast_id}: {e}")
+        await status_message.answer(f"❌ Рассылка прервана: {e}\nЕё продолжит планировщик бота.")
+        return
+    
+    if result is None:
+        await status_message.answer("ℹ️ Рассылку продолжает другой процесс бота.")
+        return
+    sent, failed = result
+    
+    await status_message.answer(
+        f"✅ Рассылка завершена!\n\n"
+        f"📨 Отправлено: {sent}\n"
+        f"❌ Ошибок: {failed}"
+    )
+
 @router.callback_query(AdminStates.waiting_broadcast_confirm, F.data == "cancel_broadcast")
 async def admin_broadcast_cancel(callback: CallbackQuery, state: FSMContext):
     if not is_admin(callback.from_user.id):
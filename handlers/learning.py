@@ -1,10 +1,10 @@
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
-from sqlalchemy import select
+from sqlalchemy import select, func, literal
 from datetime import datetime
-from database import get_db
-from models import User, UserProgress, Bookmark  
+from database import get_db, dialect_insert
+from models import User, UserProgress, Bookmark, LessonCompletion
 from keyboards import (
     get_main_menu_keyboard,
     get_categories_keyboard,
@@ -14,6 +14,9 @@ from keyboards import (
     get_continue_keyboard
 )
 from utils.json_db import json_db
+from services.streaks import update_streak
+from services.achievements import check_metric_achievements
+from services.xp import xp_ledger, XP_PER_LESSON, XP_PER_COURSE
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -63,8 +66,7 @@ async def subcategory_selected(callback: CallbackQuery, state: FSMContext):
     sub_id = int(callback.data.split("_")[1])
     telegram_id = callback.from_user.id
     
-    materials = json_db.get_materials(sub_id)
-    materials = sorted(materials, key=lambda x: x['order_num'])
+    materials = json_db.get_content_index().get_lessons(sub_id)
     
     if not materials:
         await callback.answer("В этой подкатегории пока нет материалов", show_alert=True)
@@ -93,8 +95,7 @@ async def subcategory_selected(callback: CallbackQuery, state: FSMContext):
                 total_materials=len(materials)
             )
             
-            subcat_info = json_db.get_subcategory(sub_id)
-            subcat_name = subcat_info['name'] if subcat_info else "этот курс"
+            subcat_name = json_db.get_content_index().subcategory_name(sub_id, "этот курс")
             
             await callback.message.edit_text(
                 f"📚 **Вы уже начали курс '{subcat_name}'**\n\n"
@@ -159,13 +160,15 @@ async def restart_course(callback: CallbackQuery, state: FSMContext):
 
 async def start_learning(message, sub_id, start_index, telegram_id):
     """Начать обучение с указанного урока"""
-    materials = json_db.get_materials(sub_id)
-    materials = sorted(materials, key=lambda x: x['order_num'])
+    materials = json_db.get_content_index().get_lessons(sub_id)
     
     await show_material(message, materials[start_index], start_index, len(materials), sub_id, telegram_id)
 
-async def show_material(message, material, current_index, total, sub_id, telegram_id):
-    """Показать материал урока"""
+async def show_material(message, material, current_index, total, sub_id, telegram_id, completed_id=None, move_pointer=True):
+    """
+    Показать материал урока (completed_id - урок, который пользователь только что прошёл).
+    move_pointer=False - просмотр без сдвига места, с которого продолжается курс
+    """
     async for db in get_db():
         user = await db.execute(select(User).where(User.tg_id == telegram_id))
         user = user.scalar_one()
@@ -177,9 +180,70 @@ async def show_material(message, material, current_index, total, sub_id, telegra
             )
         )
         progress = progress.scalar_one()
-        progress.current_material_index = current_index
+        if move_pointer:
+            progress.current_material_index = current_index
         progress.last_accessed = datetime.utcnow()
+        
+        # Пройденные уроки: тот, с которого ушли кнопкой "Далее", и последний урок курса -
+        # у него нет кнопки "Далее", поэтому он засчитывается при просмотре
+        is_last = current_index == total - 1
+        completed = progress.completed_materials or []
+        new_lessons = [
+            m_id for m_id in dict.fromkeys((completed_id, material['id'] if is_last else None))
+            if m_id is not None and m_id not in completed
+        ]
+        if new_lessons:
+            progress.completed_materials = completed + new_lessons
+            # Опыт и счётчик уроков - только за уроки, которые пользователь ещё ни разу не проходил
+            # (completed_materials очищается при перезапуске курса, lesson_completions - нет)
+            now = datetime.utcnow()
+            awarded = await db.execute(
+                dialect_insert(LessonCompletion)
+                .values([{"user_id": user.id, "material_id": m_id, "completed_at": now} for m_id in new_lessons])
+                .on_conflict_do_nothing(index_elements=["user_id", "material_id"])
+                .returning(LessonCompletion.material_id)
+            )
+            new_lessons = awarded.scalars().all()
+        
+        # Курс завершён, когда пройдены все его уроки, а не просто открыт последний
+        lesson_ids = {m['id'] for m in json_db.get_content_index().get_lessons(sub_id)}
+        course_completed = (
+            progress.completed_at is None
+            and bool(lesson_ids)
+            and lesson_ids <= set(progress.completed_materials or [])
+        )
+        if course_completed:
+            progress.completed_at = datetime.utcnow()
+        
+        streak = update_streak(user)
         await db.commit()
+        
+        new_achievements = []
+        if new_lessons:
+            # users.lessons_completed обновит сброс журнала опыта, поэтому
+            # для достижений число уроков берём из lesson_completions
+            xp_ledger.award(user.id, XP_PER_LESSON * len(new_lessons), "lesson", lessons=len(new_lessons))
+            lessons_count = await db.scalar(
+                select(func.count()).select_from(LessonCompletion).where(LessonCompletion.user_id == user.id)
+            )
+            new_achievements += await check_metric_achievements(
+                db, user.id, "lessons", lessons_count, lessons_count - len(new_lessons)
+            )
+        if course_completed:
+            xp_ledger.award(user.id, XP_PER_COURSE, "course")
+            courses_count = await db.execute(
+                select(func.count(UserProgress.id)).where(
+                    UserProgress.user_id == user.id,
+                    UserProgress.completed_at.isnot(None)
+                )
+            )
+            courses_count = courses_count.scalar() or 0
+            new_achievements += await check_metric_achievements(
+                db, user.id, "courses", courses_count, courses_count - 1
+            )
+        if streak:
+            previous_streak, current_streak = streak
+            new_achievements += await check_metric_achievements(db, user.id, "streak", current_streak, previous_streak)
     
     if material['content_type'] == "text":
         text = f"**{material['name']}**\n\n"
@@ -235,6 +299,15 @@ async def show_material(message, material, current_index, total, sub_id, telegra
             text,
             reply_markup=get_material_navigation_keyboard(current_index, total, sub_id, material['id'])
         )
+    
+    await notify_achievements(message, new_achievements)
+
+async def notify_achievements(message, achievements):
+    """Сообщить пользователю о новых достижениях"""
+    for ach in achievements:
+        await message.answer(
+            f"{ach['icon']} **Новое достижение: {ach['name']}**\n{ach['description'] or ''}"
+        )
 
 @router.callback_query(F.data.startswith("next_"))
 async def next_material(callback: CallbackQuery, state: FSMContext):
@@ -244,8 +317,7 @@ async def next_material(callback: CallbackQuery, state: FSMContext):
     current = int(parts[2])
     telegram_id = callback.from_user.id
     
-    materials = json_db.get_materials(sub_id)
-    materials = sorted(materials, key=lambda x: x['order_num'])
+    materials = json_db.get_content_index().get_lessons(sub_id)
     
     if current + 1 >= len(materials):
         await callback.message.edit_text(
@@ -257,7 +329,10 @@ async def next_material(callback: CallbackQuery, state: FSMContext):
         return
     
     await callback.message.delete()
-    await show_material(callback.message, materials[current + 1], current + 1, len(materials), sub_id, telegram_id)
+    await show_material(
+        callback.message, materials[current + 1], current + 1, len(materials), sub_id, telegram_id,
+        completed_id=materials[current]['id']
+    )
     await callback.answer()
 
 @router.callback_query(F.data.startswith("prev_"))
@@ -272,13 +347,50 @@ async def prev_material(callback: CallbackQuery, state: FSMContext):
         await callback.answer("Это первый урок", show_alert=True)
         return
     
-    materials = json_db.get_materials(sub_id)
-    materials = sorted(materials, key=lambda x: x['order_num'])
+    materials = json_db.get_content_index().get_lessons(sub_id)
     
     await callback.message.delete()
     await show_material(callback.message, materials[current - 1], current - 1, len(materials), sub_id, telegram_id)
     await callback.answer()
 
+@router.callback_query(F.data.startswith("open_"))
+async def open_material(callback: CallbackQuery):
+    """Открыть урок из закладок"""
+    material_id = int(callback.data.split("_")[1])
+    telegram_id = callback.from_user.id
+    
+    content = json_db.get_content_index()
+    material = content.materials.get(material_id)
+    if not material:
+        await callback.answer("❌ Материал больше недоступен", show_alert=True)
+        return
+    sub_id = material['subcategory_id']
+    
+    async for db in get_db():
+        user = await db.execute(select(User.id).where(User.tg_id == telegram_id))
+        user_id = user.scalar_one_or_none()
+        if user_id is None:
+            await callback.answer("Сначала зарегистрируйтесь", show_alert=True)
+            return
+        
+        progress = await db.execute(
+            select(UserProgress.id).where(
+                UserProgress.user_id == user_id,
+                UserProgress.subcategory_id == sub_id
+            )
+        )
+        if progress.scalar_one_or_none() is None:
+            db.add(UserProgress(user_id=user_id, subcategory_id=sub_id, current_material_index=0, completed_materials=[]))
+            await db.commit()
+        break
+    
+    # Урок из закладок не должен сбивать место, с которого пользователь продолжит курс
+    await show_material(
+        callback.message, material, content.material_positions[material_id],
+        content.lesson_count(sub_id), sub_id, telegram_id, move_pointer=False
+    )
+    await callback.answer()
+
 @router.callback_query(F.data == "back_to_categories")
 async def back_to_categories(callback: CallbackQuery):
     """Назад к категориям"""
@@ -306,41 +418,39 @@ async def save_material(callback: CallbackQuery):
     material_id = int(callback.data.split("_")[1])
     telegram_id = callback.from_user.id
     
-    material = json_db.get_material(material_id)
+    material = json_db.get_content_index().materials.get(material_id)
     if not material:
         await callback.answer("❌ Материал не найден", show_alert=True)
         return
     
+    # Один запрос: id пользователя берётся подзапросом по tg_id, дубликат
+    # отсекает уникальный индекс (user_id, material_id) - без гонки при двойном нажатии
+    stmt = dialect_insert(Bookmark).from_select(
+        ["user_id", "material_id", "subcategory_id", "material_name"],
+        select(
+            User.id,
+            literal(material_id),
+            literal(material['subcategory_id']),
+            literal(material['name'])
+        ).where(User.tg_id == telegram_id)
+    )
+    stmt = stmt.on_conflict_do_nothing(index_elements=["user_id", "material_id"]).returning(Bookmark.id)
+    
     async for db in get_db():
         try:
-            user = await db.execute(select(User).where(User.tg_id == telegram_id))
-            user = user.scalar_one()
-            
-            from models import Bookmark
-            existing = await db.execute(
-                select(Bookmark).where(
-                    Bookmark.user_id == user.id,
-                    Bookmark.material_id == material_id
-                )
-            )
-            if existing.scalar_one_or_none():
-                await callback.answer("❌ Этот материал уже в закладках", show_alert=True)
-                return
-            
-            bookmark = Bookmark(
-                user_id=user.id,
-                material_id=material_id,
-                subcategory_id=material['subcategory_id'],
-                material_name=material['name']
-            )
-            db.add(bookmark)
+            saved = await db.execute(stmt)
+            saved = saved.scalar_one_or_none()
             await db.commit()
-            
-            await callback.answer("⭐ Материал сохранен в закладки!", show_alert=True)
-            
         except Exception as e:
             logger.error(f"Ошибка при сохранении в закладки: {e}")
             await callback.answer("❌ Ошибка при сохранении", show_alert=True)
+            return
+        
+        if saved is None:
+            await callback.answer("❌ Этот материал уже в закладках", show_alert=True)
+        else:
+            await callback.answer("⭐ Материал сохранен в закладки!", show_alert=True)
+        break
 
 @router.callback_query(F.data.startswith("rate_"))
 async def rate_course(callback: CallbackQuery):
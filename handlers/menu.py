@@ -1,16 +1,23 @@
 from aiogram import Router, F
+from aiogram.filters import Command, CommandObject
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
-from sqlalchemy import select, func
+from sqlalchemy import select, func, tuple_
+from datetime import datetime
 from database import get_db
 from models import User, UserProgress, Bookmark
 from keyboards import (
     get_main_menu_keyboard,
     back_button,
-    get_rating_keyboard
+    get_rating_keyboard,
+    get_page_keyboard
 )
 from utils.json_db import json_db
 from utils.helpers import format_profile, get_random_tip
+from services.notifications import DAILY_TIP_HOUR
+from services.xp import xp_ledger
+from services.stats import bot_stats
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -18,6 +25,12 @@ logger = logging.getLogger(__name__)
 
 router = Router()
 
+# Сколько курсов показывать на одной странице прогресса
+PROGRESS_PAGE_SIZE = 10
+# Закладок на странице и формат курсора (added_at с микросекундами) в callback_data
+BOOKMARKS_PAGE_SIZE = 10
+BOOKMARK_CURSOR_FORMAT = "%Y%m%d%H%M%S%f"
+
 
 @router.message(F.text == "👤 Профиль")
 async def profile_handler(message: Message):
@@ -39,77 +52,212 @@ async def profile_handler(message: Message):
             await message.answer(profile_text, reply_markup=back_button("back_to_main"))
         break
 
+@router.message(Command("timezone"))
+async def timezone_handler(message: Message, command: CommandObject):
+    """Установить часовой пояс для советов дня"""
+    tz_name = (command.args or "").strip()
+    if not tz_name:
+        await message.answer(
+            "🕘 Укажите часовой пояс, например:\n<code>/timezone Europe/Moscow</code>"
+        )
+        return
+    try:
+        ZoneInfo(tz_name)
+    except (ZoneInfoNotFoundError, ValueError):
+        await message.answer("❌ Неизвестный часовой пояс. Пример: <code>Asia/Tashkent</code>")
+        return
+    async for db in get_db():
+        user = await db.execute(select(User).where(User.tg_id == message.from_user.id))
+        user = user.scalar_one_or_none()
+        if not user:
+            await message.answer("❌ Сначала зарегистрируйтесь через /start")
+            return
+        user.timezone = tz_name
+        await db.commit()
+        await message.answer(
+            f"✅ Часовой пояс сохранён: <b>{tz_name}</b>\n"
+            f"Советы дня будут приходить около {DAILY_TIP_HOUR}:00 по вашему времени."
+        )
+        break
+
+async def build_progress_page(db, telegram_id: int, page: int = 0):
+    """
+    Страница прогресса одним запросом: пользователь и его курсы (LEFT JOIN),
+    названия и число уроков - из индекса контента в памяти.
+    Возвращает (текст, клавиатура) или None, если пользователь не найден
+    """
+    rows = await db.execute(
+        select(UserProgress.subcategory_id, UserProgress.current_material_index, UserProgress.completed_at)
+        .select_from(User)
+        .outerjoin(UserProgress, UserProgress.user_id == User.id)
+        .where(User.tg_id == telegram_id)
+        .order_by(UserProgress.last_accessed.desc(), UserProgress.id.desc())
+        .offset(page * PROGRESS_PAGE_SIZE)
+        .limit(PROGRESS_PAGE_SIZE + 1)
+    )
+    rows = rows.all()
+    if not rows and page == 0:
+        return None
+    rows = [r for r in rows if r.subcategory_id is not None]
+    if not rows:
+        # При листании сообщение редактируется - там допустима только inline-клавиатура
+        keyboard = back_button("back_to_main") if page else get_main_menu_keyboard()
+        return "📊 Вы ещё не начали ни одного курса.\nНажмите '📚 Курсы' чтобы начать!", keyboard
+
+    has_next = len(rows) > PROGRESS_PAGE_SIZE
+    content = json_db.get_content_index()
+    text = "📊 **Ваш прогресс:**\n\n"
+    for p in rows[:PROGRESS_PAGE_SIZE]:
+        subcat_name = content.subcategory_name(p.subcategory_id, f"ID: {p.subcategory_id}")
+        total = content.lesson_count(p.subcategory_id)
+        if total > 0:
+            # Указатель стоит на последнем открытом уроке, поэтому у пройденного курса он на 1 меньше total
+            done = total if p.completed_at else p.current_material_index
+            percent = (done / total) * 100
+            emoji = "✅" if p.completed_at else "🔄"
+            text += f"{emoji} **{subcat_name}**: {done}/{total} ({percent:.1f}%)\n"
+        else:
+            text += f"📌 **{subcat_name}**: {p.current_material_index} уроков\n"
+    if page or has_next:
+        text += f"\nСтраница {page + 1}"
+
+    keyboard = get_page_keyboard(
+        prev_cb=f"progress_page_{page - 1}" if page > 0 else None,
+        next_cb=f"progress_page_{page + 1}" if has_next else None
+    )
+    return text, keyboard
+
 @router.message(F.text == "📊 Прогресс")
 async def progress_handler(message: Message):
     """Показать прогресс пользователя"""
-    telegram_id = message.from_user.id
     async for db in get_db():
-        user = await db.execute(select(User).where(User.tg_id == telegram_id))
-        user = user.scalar_one_or_none()
-        if not user:
+        result = await build_progress_page(db, message.from_user.id)
+        if result is None:
             await message.answer("❌ Сначала зарегистрируйтесь.")
             return
-        progresses = await db.execute(select(UserProgress).where(UserProgress.user_id == user.id))
-        progresses = progresses.scalars().all()
-        if not progresses:
-            await message.answer("📊 Вы ещё не начали ни одного курса.\nНажмите '📚 Курсы' чтобы начать!", reply_markup=get_main_menu_keyboard())
+        text, keyboard = result
+        await message.answer(text, reply_markup=keyboard)
+        break
+
+@router.callback_query(F.data.startswith("progress_page_"))
+async def progress_page_handler(callback: CallbackQuery):
+    """Листание страниц прогресса"""
+    page = max(0, int(callback.data.rsplit("_", 1)[1]))
+    async for db in get_db():
+        result = await build_progress_page(db, callback.from_user.id, page)
+        if result is None:
+            await callback.answer("❌ Сначала зарегистрируйтесь.", show_alert=True)
             return
-        text = "📊 **Ваш прогресс:**\n\n"
-        for p in progresses:
-            subcat = json_db.get_subcategory(p.subcategory_id)
-            subcat_name = subcat['name'] if subcat else f"ID: {p.subcategory_id}"
-            materials = json_db.get_materials(p.subcategory_id)
-            total = len(materials)
-            if total > 0:
-                percent = (p.current_material_index / total) * 100
-                emoji = "✅" if p.current_material_index >= total else "🔄"
-                text += f"{emoji} **{subcat_name}**: {p.current_material_index}/{total} ({percent:.1f}%)\n"
-            else:
-                text += f"📌 **{subcat_name}**: {p.current_material_index} уроков\n"
-        await message.answer(text, reply_markup=back_button("back_to_main"))
+        text, keyboard = result
+        await callback.message.edit_text(text, reply_markup=keyboard)
         break
+    await callback.answer()
 
 @router.message(F.text == "🏆 ТОП-10")
 async def top10_handler(message: Message):
     """Показать топ-10 пользователей"""
     async for db in get_db():
-        top_users = await db.execute(select(User).order_by(User.xp.desc()).limit(10))
-        top_users = top_users.scalars().all()
+        top_users = await xp_ledger.leaderboard.top(db)
         if not top_users:
             await message.answer("🏆 Пока нет данных для топа.", reply_markup=get_main_menu_keyboard())
             return
         text = "🏆 **ТОП-10 пользователей**\n\n"
         for i, user in enumerate(top_users, 1):
             medal = "🥇" if i == 1 else "🥈" if i == 2 else "🥉" if i == 3 else "👤"
-            text += f"{medal} {i}. {user.name} — {user.xp} XP (ур.{user.level})\n"
+            text += f"{medal} {i}. {user['name']} — {user['xp']} XP (ур.{user['level']})\n"
         await message.answer(text, reply_markup=back_button("back_to_main"))
         break
 
+def _bookmark_cursor(bookmark) -> str:
+    """Позиция закладки для callback_data: время добавления и id"""
+    return f"{bookmark.added_at.strftime(BOOKMARK_CURSOR_FORMAT)}_{bookmark.id}"
+
+async def build_bookmarks_page(db, telegram_id: int, after: str = None, before: str = None):
+    """
+    Страница закладок по ключу (added_at, id), от новых к старым:
+    after - показать закладки старше курсора, before - новее курсора.
+    Стоимость зависит от размера страницы, а не от числа закладок.
+    Возвращает (текст, клавиатура) или None, если пользователь не найден
+    """
+    user_id = await db.execute(select(User.id).where(User.tg_id == telegram_id))
+    user_id = user_id.scalar_one_or_none()
+    if user_id is None:
+        return None
+
+    key = tuple_(Bookmark.added_at, Bookmark.id)
+    query = select(Bookmark).where(Bookmark.user_id == user_id)
+    if before:
+        added_at, bookmark_id = before.rsplit("_", 1)
+        query = query.where(key > tuple_(datetime.strptime(added_at, BOOKMARK_CURSOR_FORMAT), int(bookmark_id)))
+        query = query.order_by(Bookmark.added_at.asc(), Bookmark.id.asc())
+    else:
+        if after:
+            added_at, bookmark_id = after.rsplit("_", 1)
+            query = query.where(key < tuple_(datetime.strptime(added_at, BOOKMARK_CURSOR_FORMAT), int(bookmark_id)))
+        query = query.order_by(Bookmark.added_at.desc(), Bookmark.id.desc())
+
+    bookmarks = await db.execute(query.limit(BOOKMARKS_PAGE_SIZE + 1))
+    bookmarks = bookmarks.scalars().all()
+    has_more = len(bookmarks) > BOOKMARKS_PAGE_SIZE
+    bookmarks = bookmarks[:BOOKMARKS_PAGE_SIZE]
+    if before:
+        bookmarks.reverse()
+
+    if not bookmarks:
+        if after or before:
+            return await build_bookmarks_page(db, telegram_id)
+        return (
+            "⭐ **Ваши закладки**\n\nУ вас пока нет сохраненных материалов.\n\nЧтобы сохранить материал, нажмите кнопку '⭐ Сохранить' во время урока.",
+            back_button("back_to_main")
+        )
+
+    content = json_db.get_content_index()
+    text = "⭐ **Ваши закладки**\n\n"
+    buttons = []
+    for i, b in enumerate(bookmarks, 1):
+        subcat_name = content.subcategory_name(b.subcategory_id, "Неизвестный курс")
+        text += f"{i}. **{b.material_name}**\n   📚 Курс: {subcat_name}\n   📅 {b.added_at.strftime('%d.%m.%Y')}\n\n"
+        buttons.append((f"▶️ {i}. {(b.material_name or '')[:40]}", f"open_{b.material_id}"))
+
+    # Назад к новым есть, если пришли курсором; вперёд к старым - если осталось ещё
+    has_newer = has_more if before else bool(after)
+    has_older = bool(before) or has_more
+    keyboard = get_page_keyboard(
+        prev_cb=f"bm_before_{_bookmark_cursor(bookmarks[0])}" if has_newer else None,
+        next_cb=f"bm_after_{_bookmark_cursor(bookmarks[-1])}" if has_older else None,
+        extra=buttons
+    )
+    return text, keyboard
+
 @router.message(F.text == "⭐ Закладки")
 async def bookmarks_handler(message: Message):
     """Показать сохраненные материалы"""
-    telegram_id = message.from_user.id
     async for db in get_db():
-        user = await db.execute(select(User).where(User.tg_id == telegram_id))
-        user = user.scalar_one_or_none()
-        if not user:
+        result = await build_bookmarks_page(db, message.from_user.id)
+        if result is None:
             await message.answer("❌ Сначала зарегистрируйтесь.", reply_markup=get_main_menu_keyboard())
             return
-        bookmarks = await db.execute(select(Bookmark).where(Bookmark.user_id == user.id).order_by(Bookmark.added_at.desc()))
-        bookmarks = bookmarks.scalars().all()
-        if not bookmarks:
-            await message.answer(
-                "⭐ **Ваши закладки**\n\nУ вас пока нет сохраненных материалов.\n\nЧтобы сохранить материал, нажмите кнопку '⭐ Сохранить' во время урока.",
-                reply_markup=back_button("back_to_main")
-            )
+        text, keyboard = result
+        await message.answer(text, reply_markup=keyboard)
+        break
+
+@router.callback_query(F.data.startswith("bm_"))
+async def bookmarks_page_handler(callback: CallbackQuery):
+    """Листание закладок: bm_after_<курсор> - старше, bm_before_<курсор> - новее"""
+    _, direction, cursor = callback.data.split("_", 2)
+    async for db in get_db():
+        result = await build_bookmarks_page(
+            db, callback.from_user.id,
+            after=cursor if direction == "after" else None,
+            before=cursor if direction == "before" else None
+        )
+        if result is None:
+            await callback.answer("❌ Сначала зарегистрируйтесь.", show_alert=True)
             return
-        text = "⭐ **Ваши закладки**\n\n"
-        for i, b in enumerate(bookmarks, 1):
-            subcat = json_db.get_subcategory(b.subcategory_id)
-            subcat_name = subcat['name'] if subcat else "Неизвестный курс"
-            text += f"{i}. **{b.material_name}**\n   📚 Курс: {subcat_name}\n   📅 {b.added_at.strftime('%d.%m.%Y')}\n\n"
-        await message.answer(text, reply_markup=back_button("back_to_main"))
+        text, keyboard = result
+        await callback.message.edit_text(text, reply_markup=keyboard)
         break
+    await callback.answer()
     
 @router.callback_query(F.data == "back_to_main")
 async def back_to_main_handler(callback: CallbackQuery):
@@ -150,22 +298,17 @@ async def faq_handler(message: Message):
 @router.message(F.text == "ℹ️ О боте")
 async def about_handler(message: Message):
     """Информация о боте"""
-    categories_count = len(json_db.get_categories())
-    subcategories_count = len(json_db.get_subcategories())
-    materials_count = len(json_db.get_materials())
-    async for db in get_db():
-        users_count = await db.execute(select(func.count(User.id)))
-        users_count = users_count.scalar()
+    stats = bot_stats.snapshot
     tip = json_db.get_random_tip()
     text = (
         f"ℹ️ **О MentorAI Bot**\n\n"
         f"**Версия:** 2.0.0\n"
         f"**Описание:** Интерактивный бот для обучения\n\n"
         f"📊 **Статистика:**\n"
-        f"• Категорий: {categories_count}\n"
-        f"• Подкатегорий: {subcategories_count}\n"
-        f"• Материалов: {materials_count}\n"
-        f"• Пользователей: {users_count}\n\n"
+        f"• Категорий: {stats.categories}\n"
+        f"• Подкатегорий: {stats.subcategories}\n"
+        f"• Материалов: {stats.materials}\n"
+        f"• Пользователей: {stats.users}\n\n"
         f"🎯 **Возможности:**\n"
         f"• Изучение материалов\n"
         f"• Отслеживание прогресса\n"
@@ -7,6 +7,7 @@ from keyboards import get_main_menu_keyboard, get_cancel_keyboard, get_roles_key
 from database import get_db
 from models import User
 from sqlalchemy import select
+from services.stats import bot_stats
 import re
 from keyboards import (
     get_main_menu_keyboard,  
@@ -204,6 +205,7 @@ async def process_confirm(callback: CallbackQuery, state: FSMContext):
         )
         db.add(user)
         await db.commit()
+        bot_stats.user_registered()
         
         await callback.message.delete()
         await callback.message.answer(
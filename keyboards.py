@@ -33,6 +33,7 @@ def get_admin_reply_keyboard():
         [KeyboardButton(text="🗑 Удалить подкатегорию")],
         [KeyboardButton(text="🗑 Удалить материал")],
         [KeyboardButton(text="📊 Статистика")],
+        [KeyboardButton(text="📈 Активность")],
         [KeyboardButton(text="🏆 ТОП-10 (админ)")],
         [KeyboardButton(text="📨 Рассылка")],
         [KeyboardButton(text="🚪 Выход")]
@@ -186,6 +187,31 @@ def get_confirm_keyboard_admin(action="material"):
     builder.adjust(2)
     return builder.as_markup()
 
+def get_broadcast_confirm_keyboard(content_type: str):
+    """Подтверждение рассылки: для медиа доступен режим копирования"""
+    builder = InlineKeyboardBuilder()
+    builder.add(InlineKeyboardButton(text="✅ Да", callback_data="confirm_broadcast"))
+    if content_type != "text":
+        builder.add(InlineKeyboardButton(text="📋 Да, копированием", callback_data="confirm_broadcast_copy"))
+    builder.add(InlineKeyboardButton(text="❌ Нет", callback_data="cancel_broadcast"))
+    builder.adjust(2)
+    return builder.as_markup()
+
+def get_page_keyboard(prev_cb: str = None, next_cb: str = None, back_cb: str = "back_to_main", extra=None):
+    """Навигация по страницам списка: extra - пары (текст, callback_data) над стрелками"""
+    builder = InlineKeyboardBuilder()
+    for text, cb_data in extra or ():
+        builder.row(InlineKeyboardButton(text=text, callback_data=cb_data))
+    nav = []
+    if prev_cb:
+        nav.append(InlineKeyboardButton(text="⬅️", callback_data=prev_cb))
+    if next_cb:
+        nav.append(InlineKeyboardButton(text="➡️", callback_data=next_cb))
+    if nav:
+        builder.row(*nav)
+    builder.row(InlineKeyboardButton(text="⬅️ Назад", callback_data=back_cb))
+    return builder.as_markup()
+
 def get_sponsors_inline(sponsors, action="delete"):
     """Клавиатура выбора спонсора"""
     builder = InlineKeyboardBuilder()
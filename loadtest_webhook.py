@@ -0,0 +1,140 @@
+"""
+Нагрузочный тест режима webhook на локальной машине.
+
+1. Поддельный Bot API, который отвечает "ok" на любой метод:
+       python loadtest_webhook.py fake-api --port 8081
+2. Бот в режиме webhook, направленный на поддельный API:
+       BOT_MODE=webhook WEBHOOK_URL=http://127.0.0.1:8080 WEBHOOK_SECRET=test \\
+       TELEGRAM_API_URL=http://127.0.0.1:8081 python main.py
+3. Прогон синтетических апдейтов:
+       python loadtest_webhook.py run --url http://127.0.0.1:8080/webhook --secret test \\
+           --updates 5000 --concurrency 100 --users 500
+"""
+import argparse
+import asyncio
+import itertools
+import random
+import time
+from aiohttp import web, ClientSession, TCPConnector
+
+# Тексты кнопок, которые не требуют регистрации и не меняют данные
+TEXTS = ["❓ FAQ", "ℹ️ О боте", "📊 Прогресс", "⭐ Закладки", "🏆 ТОП-10"]
+
+
+def fake_api_app(calls: list = None) -> web.Application:
+    """
+    Bot API, отвечающий на любой метод успешным результатом.
+    В calls (если передан) записываются пары (метод, chat_id)
+    """
+    message_ids = itertools.count(1)
+    stats = {"calls": 0}
+
+    async def handle(request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        stats["calls"] += 1
+        if request.content_type == "application/json":
+            data = await request.json()
+        else:
+            data = dict(await request.post())
+        if calls is not None:
+            calls.append((method, str(data.get("chat_id", ""))))
+
+        if method == "getme":
+            result = {"id": 1, "is_bot": True, "first_name": "LoadTest", "username": "loadtest_bot"}
+        elif method == "copymessage":
+            result = {"message_id": next(message_ids)}
+        elif method.startswith(("send", "edit")):
+            result = {
+                "message_id": next(message_ids),
+                "date": int(time.time()),
+                "chat": {"id": int(data.get("chat_id", 0) or 0), "type": "private"},
+                "text": str(data.get("text", ""))
+            }
+        elif method == "getchatmember":
+            result = {"status": "member", "user": {"id": int(data.get("user_id", 0) or 0), "is_bot": False, "first_name": "u"}}
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def report(app):
+        print(f"📊 Поддельный API: обработано вызовов {stats['calls']}")
+
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", handle)
+    app.on_shutdown.append(report)
+    return app
+
+
+def make_update(update_id: int, user_id: int) -> dict:
+    user = {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": user,
+            "text": random.choice(TEXTS)
+        }
+    }
+
+
+async def run_load(url: str, secret: str, updates: int, concurrency: int, users: int):
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+    latencies = []
+    statuses = {}
+    queue = asyncio.Queue()
+    for update_id in range(1, updates + 1):
+        queue.put_nowait(make_update(update_id, 100000 + random.randrange(users)))
+
+    async def worker(session: ClientSession):
+        while True:
+            try:
+                update = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            started = time.perf_counter()
+            async with session.post(url, json=update, headers=headers) as response:
+                await response.read()
+                statuses[response.status] = statuses.get(response.status, 0) + 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    async with ClientSession(connector=TCPConnector(limit=concurrency)) as session:
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+
+    def percentile(p: float) -> float:
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    print(f"📨 Апдейтов: {updates} за {elapsed:.2f} с ({updates / elapsed:.0f} в секунду)")
+    print(f"⏱ Задержка ответа: p50 {percentile(0.5):.1f} мс, p95 {percentile(0.95):.1f} мс, p99 {percentile(0.99):.1f} мс")
+    print(f"📋 Коды ответа: {statuses}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест вебхука бота")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    fake = commands.add_parser("fake-api", help="поддельный Bot API")
+    fake.add_argument("--host", default="127.0.0.1")
+    fake.add_argument("--port", type=int, default=8081)
+
+    run = commands.add_parser("run", help="отправить синтетические апдейты")
+    run.add_argument("--url", default="http://127.0.0.1:8080/webhook")
+    run.add_argument("--secret", default="")
+    run.add_argument("--updates", type=int, default=5000)
+    run.add_argument("--concurrency", type=int, default=100)
+    run.add_argument("--users", type=int, default=500, help="сколько разных отправителей")
+
+    args = parser.parse_args()
+    if args.command == "fake-api":
+        web.run_app(fake_api_app(), host=args.host, port=args.port)
+    else:
+        asyncio.run(run_load(args.url, args.secret, args.updates, args.concurrency, args.users))
+
+
+if __name__ == "__main__":
+    main()
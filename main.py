@@ -1,27 +1,48 @@
 import asyncio
+import os
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.client.default import DefaultBotProperties
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-import selectors
 from config import Config
-from database import engine, Base, AsyncSessionLocal
+from sqlalchemy import inspect
+from database import engine, Base, AsyncSessionLocal, check_schema_revision
 from handlers import registration, menu, learning, admin, subscription
-from services.notifications import send_daily_tip
+from services.scheduler import start_scheduler, stop_scheduler
 from middlewares.subscription import SubscriptionMiddleware
 from services.achievements import initialize_achievements
+from services.broadcast import resume_broadcasts
+from services.xp import xp_ledger
+from services.stats import bot_stats
+from services.activity import activity_tracker
 from middlewares.admin_mode import AdminModeMiddleware
+from middlewares.activity import ActivityMiddleware
+from middlewares.throttling import ThrottlingMiddleware
+from utils.fsm_storage import create_storage
+from services.webhook import run_webhook
+from services.outbound import RateLimitedSession
+from utils.event_loop import setup_event_loop
 
 
-asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
-selector = selectors.SelectSelector()
-loop = asyncio.SelectorEventLoop(selector)
-asyncio.set_event_loop(loop)
+EVENT_LOOP_NAME = setup_event_loop()
 
-bot = Bot(token=Config.BOT_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
-storage = MemoryStorage()
+# polling - long polling одним процессом; webhook - aiohttp-сервер (см. services/webhook.py)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# Сбрасывать ли накопившиеся апдейты при запуске (по умолчанию они обрабатываются)
+DROP_PENDING_UPDATES = os.getenv("DROP_PENDING_UPDATES", "false").lower() == "true"
+# Свой Bot API сервер (например, локальный для нагрузочного теста)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+
+# Все исходящие запросы проходят через общий лимит и очередь с приоритетами
+session = RateLimitedSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else RateLimitedSession()
+bot = Bot(token=Config.BOT_TOKEN, session=session, default=DefaultBotProperties(parse_mode="HTML"))
+storage = create_storage()
 dp = Dispatcher(storage=storage)
 
+# Активность отмечается на уровне апдейта - до фильтров и остальных middleware
+dp.update.outer_middleware(ActivityMiddleware())
+# Апдейты пользователя - по очереди, повторные нажатия кнопки - отбрасываются
+dp.update.outer_middleware(ThrottlingMiddleware())
+
 dp.message.middleware(AdminModeMiddleware())
 dp.callback_query.middleware(AdminModeMiddleware())
 
@@ -34,39 +55,59 @@ dp.include_router(learning.router)
 dp.include_router(admin.router)
 dp.include_router(subscription.router)
 
-async def on_startup():
-    """Действия при запуске бота"""
+scheduler = None
+
+async def prepare_database():
+    """Создаёт таблицы и справочник достижений (один раз на запуск)"""
     async with engine.begin() as conn:
+        fresh = not await conn.run_sync(lambda sync_conn: inspect(sync_conn).has_table("users"))
+        await conn.run_sync(check_schema_revision, fresh)
         await conn.run_sync(Base.metadata.create_all)
     
     async with AsyncSessionLocal() as db:
         await initialize_achievements(db)
+
+async def start_services(run_scheduler: bool = True):
+    """Фоновые службы процесса; планировщик нужен только одному процессу"""
+    xp_ledger.start()
+    await bot_stats.start()
+    activity_tracker.start()
     
-    print("✅ MentorAI Bot запущен!")
+    if run_scheduler:
+        # Прерванные рассылки продолжает только лидер планировщика
+        global scheduler
+        scheduler = await start_scheduler(bot, on_leader=lambda: resume_broadcasts(bot))
+        print("⏰ Планировщик задач запущен")
+
+async def on_startup():
+    """Действия при запуске бота"""
+    await prepare_database()
+    await start_services()
+    
+    print(f"✅ MentorAI Bot запущен! (цикл событий: {EVENT_LOOP_NAME})")
     print(f"🤖 Бот: @{(await bot.me()).username}")
     print(f"👤 Админы: {Config.ADMIN_IDS}")
 
 async def on_shutdown():
     """Действия при остановке бота"""
     print("🛑 Бот остановлен")
+    if scheduler:
+        await stop_scheduler(scheduler)
+    await xp_ledger.stop()
+    await bot_stats.stop()
+    await activity_tracker.stop()
+    await storage.close()
     await bot.session.close()
 
-async def send_daily_tip_wrapper():
-    """Обертка для отправки ежедневных советов"""
-    async with AsyncSessionLocal() as db:
-        await send_daily_tip(bot, db)
-
 async def main():
-    scheduler = AsyncIOScheduler()
-    scheduler.add_job(send_daily_tip_wrapper, 'cron', hour=9, minute=0)  # Каждый день в 9:00
-    scheduler.start()
-    print("⏰ Планировщик задач запущен")
-
     dp.startup.register(on_startup)
     dp.shutdown.register(on_shutdown)
 
-    await bot.delete_webhook(drop_pending_updates=True)
-    await dp.start_polling(bot)
+    if BOT_MODE == "webhook":
+        await run_webhook(bot, dp, drop_pending_updates=DROP_PENDING_UPDATES)
+    else:
+        await bot.delete_webhook(drop_pending_updates=DROP_PENDING_UPDATES)
+        await dp.start_polling(bot)
 
 if __name__ == "__main__":
     try:
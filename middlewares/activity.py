@@ -0,0 +1,25 @@
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, User
+from typing import Callable, Dict, Any, Awaitable
+from services.activity import ActivityTracker, activity_tracker
+
+
+class ActivityMiddleware(BaseMiddleware):
+    """
+    Отмечает активность и время последнего визита пользователя
+    в буфере трекера (без запросов к БД)
+    """
+
+    def __init__(self, tracker: ActivityTracker = activity_tracker):
+        self.tracker = tracker
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user: User = data.get("event_from_user")
+        if user is not None:
+            self.tracker.record(user.id)
+        return await handler(event, data)
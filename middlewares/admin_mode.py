@@ -3,23 +3,36 @@ from aiogram.types import Message, CallbackQuery
 from typing import Callable, Dict, Any, Awaitable
 from config import Config
 
+# Множество для проверки за O(1) вместо перебора списка на каждом апдейте
+ADMIN_IDS = frozenset(Config.ADMIN_IDS)
+
+# Ключи FSM админов, у которых флаг is_admin_mode уже записан в хранилище.
+# Общий для всех экземпляров middleware (сообщения и колбэки) в процессе
+_admin_mode_keys = set()
+
+
 class AdminModeMiddleware(BaseMiddleware):
+    """
+    Включает админ-режим в FSM для администраторов.
+    Для остальных пользователей хранилище не трогается, а для админа
+    флаг читается и пишется только при первом апдейте после запуска
+    процесса - дальше известно, что он уже стоит
+    """
+
     async def __call__(
         self,
         handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
         event: Message | CallbackQuery,
         data: Dict[str, Any]
     ) -> Any:
-        if isinstance(event, Message):
-            user_id = event.from_user.id
-        else:
-            user_id = event.from_user.id
+        if event.from_user.id not in ADMIN_IDS:
+            return await handler(event, data)
         
-        if user_id in Config.ADMIN_IDS:
-            state = data.get('state')
-            if state:
-                state_data = await state.get_data()
-                if not state_data.get('is_admin_mode'):
-                    await state.update_data(is_admin_mode=True)
+        state = data.get('state')
+        if state and state.key not in _admin_mode_keys:
+            state_data = await state.get_data()
+            if not state_data.get('is_admin_mode'):
+                await state.update_data(is_admin_mode=True)
+            _admin_mode_keys.add(state.key)
         
-        return await handler(event, data)
\ No newline at end of file
+        return await handler(event, data)
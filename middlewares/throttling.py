@@ -0,0 +1,70 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update, User
+from typing import Callable, Dict, Any, Awaitable
+
+# Одинаковые нажатия одной кнопки в пределах этого окна (секунды) отбрасываются
+CALLBACK_DEBOUNCE_SECONDS = float(os.getenv("CALLBACK_DEBOUNCE_SECONDS", "1.0"))
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Апдейты одного пользователя обрабатываются строго по очереди,
+    а повторное нажатие той же inline-кнопки в течение окна не доходит
+    до хендлера - на колбэк сразу отвечаем, чтобы убрать "часики".
+    Если в данных апдейта есть update_slot (слот вебхука), на время
+    ожидания очереди пользователя он возвращается другим апдейтам
+    """
+
+    def __init__(self, debounce_seconds: float = CALLBACK_DEBOUNCE_SECONDS):
+        self.debounce_seconds = debounce_seconds
+        self._locks: Dict[int, list] = {}  # id пользователя -> [Lock, сколько апдейтов его ждут]
+        self._recent: "OrderedDict[tuple, float]" = OrderedDict()  # (пользователь, data) -> время нажатия
+
+    def _is_duplicate(self, user_id: int, payload: str) -> bool:
+        now = time.monotonic()
+        # Записи идут в порядке времени - устаревшие лежат в начале
+        while self._recent and next(iter(self._recent.values())) <= now - self.debounce_seconds:
+            self._recent.popitem(last=False)
+
+        key = (user_id, payload)
+        if key in self._recent:
+            return True
+        self._recent[key] = now
+        return False
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user: User = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+
+        callback = event.callback_query if isinstance(event, Update) else None
+        if callback is not None and callback.data and self._is_duplicate(user.id, callback.data):
+            try:
+                await callback.answer()
+            except Exception:
+                pass
+            return None
+
+        slot = data.get("update_slot")
+        entry = self._locks.setdefault(user.id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            if slot is not None and entry[0].locked():
+                slot.release()
+            async with entry[0]:
+                if slot is not None:
+                    await slot.acquire()
+                return await handler(event, data)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[user.id]
@@ -0,0 +1,50 @@
+"""
+Помощники для ревизий: изменения применяются, только если их ещё нет.
+
+Таблицы новых установок создаёт create_all при запуске бота, поэтому
+ревизии должны спокойно проходить и по уже актуальной схеме. В режиме
+--sql (без подключения к БД) выводится весь DDL ревизии.
+"""
+import sqlalchemy as sa
+from alembic import context, op
+
+
+def _inspector():
+    return sa.inspect(op.get_bind())
+
+
+def has_table(table: str) -> bool:
+    if context.is_offline_mode():
+        return True
+    return _inspector().has_table(table)
+
+
+def has_column(table: str, column: str) -> bool:
+    if context.is_offline_mode():
+        return False
+    return column in {c["name"] for c in _inspector().get_columns(table)}
+
+
+def has_index(table: str, name: str) -> bool:
+    """Индекс или ограничение уникальности с таким именем"""
+    if context.is_offline_mode():
+        return False
+    inspector = _inspector()
+    names = {i["name"] for i in inspector.get_indexes(table)}
+    names |= {c["name"] for c in inspector.get_unique_constraints(table)}
+    return name in names
+
+
+def add_column(table: str, column: sa.Column) -> bool:
+    """Добавляет столбец, если его нет; True - столбец добавлен сейчас"""
+    if not has_table(table) or has_column(table, column.name):
+        return False
+    op.add_column(table, column)
+    return True
+
+
+def create_index(name: str, table: str, columns: list, unique: bool = False) -> bool:
+    if not has_table(table) or has_index(table, name):
+        return False
+    op.create_index(name, table, columns, unique=unique)
+    return True
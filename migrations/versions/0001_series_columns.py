@@ -0,0 +1,57 @@
+"""Новые столбцы и индексы существующих таблиц
+
+Установки, созданные до этих изменений: create_all не добавляет столбцы
+в уже существующие таблицы. Новые таблицы (xp_events, settings, fsm_states
+и т.д.) по-прежнему создаёт create_all при запуске бота.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from migrations.schema import add_column, create_index
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Счётчики существующих строк начинаются с 0, а не с NULL
+    add_column("users", sa.Column("lessons_completed", sa.Integer(), server_default="0"))
+    add_column("users", sa.Column("tip_offset", sa.Integer(), server_default="0"))
+    add_column("users", sa.Column("last_tip_date", sa.Date()))
+    add_column("users", sa.Column("timezone", sa.String(50)))
+    add_column("users", sa.Column("current_streak", sa.Integer(), server_default="0"))
+    add_column("users", sa.Column("longest_streak", sa.Integer(), server_default="0"))
+    add_column("users", sa.Column("last_active_day", sa.Date()))
+    create_index("ix_users_xp", "users", ["xp"])
+    create_index("ix_users_last_active", "users", ["last_active"])
+
+    # Старые рассылки уже разосланы: "done", чтобы resume_broadcasts их не продолжал
+    add_column("broadcasts", sa.Column("mode", sa.String(10), server_default="send"))
+    add_column("broadcasts", sa.Column("status", sa.String(20), server_default="done"))
+    add_column("broadcasts", sa.Column("cursor_user_id", sa.Integer(), server_default="0"))
+    add_column("broadcasts", sa.Column("sent_count", sa.Integer(), server_default="0"))
+    add_column("broadcasts", sa.Column("failed_count", sa.Integer(), server_default="0"))
+    add_column("broadcasts", sa.Column("owner", sa.String(100)))
+    add_column("broadcasts", sa.Column("lease_expires_at", sa.DateTime()))
+    add_column("broadcasts", sa.Column("staging_chat_id", sa.BigInteger()))
+    add_column("broadcasts", sa.Column("staging_message_id", sa.Integer()))
+
+    add_column("user_progress", sa.Column("completed_at", sa.DateTime()))
+    create_index("ix_user_progress_user_completed", "user_progress", ["user_id", "completed_at"])
+
+    create_index("ix_bookmarks_user_added", "bookmarks", ["user_id", "added_at", "id"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    raise NotImplementedError("Откат не поддерживается: восстановите БД из резервной копии")
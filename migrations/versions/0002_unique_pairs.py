@@ -0,0 +1,48 @@
+"""Уникальность достижений и закладок пользователя
+
+INSERT ... ON CONFLICT в award_achievements и добавление закладок
+опираются на уникальность пар (user_id, achievement_id) и
+(user_id, material_id). В старых БД таких ограничений нет, а повторы
+возможны - перед созданием индексов остаётся самая ранняя запись пары.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+from migrations.schema import has_index, has_table
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, Sequence[str], None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+UNIQUE_PAIRS = [
+    ("uq_user_achievement", "user_achievements", ["user_id", "achievement_id"]),
+    ("uq_bookmark_user_material", "bookmarks", ["user_id", "material_id"]),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for name, table, columns in UNIQUE_PAIRS:
+        if not has_table(table) or has_index(table, name):
+            continue
+        group_by = ", ".join(columns)
+        op.execute(
+            f"DELETE FROM {table} WHERE id NOT IN "
+            f"(SELECT MIN(id) FROM {table} GROUP BY {group_by})"
+        )
+        # Уникальный индекс вместо ALTER TABLE ADD CONSTRAINT - SQLite его не поддерживает;
+        # ON CONFLICT (user_id, ...) работает с ним так же
+        op.create_index(name, table, columns, unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    raise NotImplementedError("Откат не поддерживается: восстановите БД из резервной копии")
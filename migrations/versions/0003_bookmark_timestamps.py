@@ -0,0 +1,34 @@
+"""Время добавления закладок в SQLite - с микросекундами
+
+Раньше added_at заполнялся CURRENT_TIMESTAMP, который в SQLite хранится
+без дробной части ("2026-01-01 12:00:00"). Курсор страницы закладок
+сравнивается с ним как строка с микросекундами, и закладки одной секунды
+повторялись на следующей странице. Приводим старые значения к формату,
+в котором их пишет datetime.utcnow. В PostgreSQL это обычный timestamp.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, Sequence[str], None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_context().dialect.name != "sqlite":
+        return
+    op.execute("UPDATE bookmarks SET added_at = added_at || '.000000' WHERE length(added_at) = 19")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    pass
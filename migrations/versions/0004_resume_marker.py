@@ -0,0 +1,31 @@
+"""Отметка напоминания о брошенном курсе
+
+smart_resume напоминает о курсе один раз за период простоя и запоминает
+время напоминания в user_progress.last_resume_at.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from migrations.schema import add_column
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, Sequence[str], None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    add_column("user_progress", sa.Column("last_resume_at", sa.DateTime()))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    raise NotImplementedError("Откат не поддерживается: восстановите БД из резервной копии")
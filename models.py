@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, BigInteger, String, Boolean, DateTime, JSON, Text, ForeignKey
+from datetime import datetime
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, Date, DateTime, Float, JSON, Text, ForeignKey, UniqueConstraint, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from database import Base
@@ -13,10 +14,19 @@ class User(Base):
     role = Column(String(50))
     photo_file_id = Column(String(255))
     level = Column(Integer, default=1)
-    xp = Column(Integer, default=0)
+    xp = Column(Integer, default=0, index=True)  # индекс - для топа по опыту
+    lessons_completed = Column(Integer, default=0)
     is_subscribed = Column(Boolean, default=False)
-    last_active = Column(DateTime, default=func.now())
-    registered_at = Column(DateTime, default=func.now())
+    tip_offset = Column(Integer, default=0)  # сколько советов дня уже получено (позиция в ротации)
+    last_tip_date = Column(Date)  # местный день, за который совет дня уже отправлен
+    timezone = Column(String(50))  # IANA, например "Europe/Moscow"; None - часовой пояс бота
+    # Серия дней обучения подряд (обновляется при каждом просмотре урока)
+    current_streak = Column(Integer, default=0)
+    longest_streak = Column(Integer, default=0)
+    last_active_day = Column(Date)  # последний день с уроком по местному времени пользователя
+    # Время хранится в UTC (datetime.utcnow), как и у всех, кто его читает; func.now() в PostgreSQL - время сервера
+    last_active = Column(DateTime, default=datetime.utcnow, index=True)
+    registered_at = Column(DateTime, default=datetime.utcnow)
     
     progress = relationship("UserProgress", back_populates="user", cascade="all, delete-orphan")
     achievements = relationship("UserAchievement", back_populates="user", cascade="all, delete-orphan")
@@ -39,15 +49,30 @@ class Broadcast(Base):
     button_text = Column(String(50))
     button_url = Column(String(255))
     sent_at = Column(DateTime, default=func.now())
+    # Режим доставки: "send" - отправка заново, "copy" - копирование из служебного чата
+    mode = Column(String(10), default="send")
+    status = Column(String(20), default="running")
+    # Курсор для возобновления: последний обработанный users.id
+    cursor_user_id = Column(Integer, default=0)
+    sent_count = Column(Integer, default=0)
+    failed_count = Column(Integer, default=0)
+    # Процесс, который ведёт рассылку, и до какого времени действует его аренда
+    owner = Column(String(100))
+    lease_expires_at = Column(DateTime)
+    staging_chat_id = Column(BigInteger)
+    staging_message_id = Column(Integer)
 
 class UserProgress(Base):
     __tablename__ = "user_progress"
+    __table_args__ = (Index("ix_user_progress_user_completed", "user_id", "completed_at"),)
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     subcategory_id = Column(Integer, nullable=False)  # ID из JSON
     current_material_index = Column(Integer, default=0)
     completed_materials = Column(JSON, default=list)
     last_accessed = Column(DateTime, default=func.now())
+    completed_at = Column(DateTime)  # когда пройдены все уроки курса; None - курс не завершён
+    last_resume_at = Column(DateTime)  # когда отправлено напоминание smart_resume о курсе
 
     user = relationship("User", back_populates="progress")
 
@@ -63,6 +88,7 @@ class Achievement(Base):
 
 class UserAchievement(Base):
     __tablename__ = "user_achievements"
+    __table_args__ = (UniqueConstraint("user_id", "achievement_id", name="uq_user_achievement"),)
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     achievement_id = Column(Integer, ForeignKey("achievements.id"), nullable=False)
@@ -73,11 +99,82 @@ class UserAchievement(Base):
 
 class Bookmark(Base):
     __tablename__ = "bookmarks"
+    # Постраничный вывод идёт по ключу (user_id, added_at, id)
+    __table_args__ = (
+        UniqueConstraint("user_id", "material_id", name="uq_bookmark_user_material"),
+        Index("ix_bookmarks_user_added", "user_id", "added_at", "id"),
+    )
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     material_id = Column(Integer, nullable=False)  
     subcategory_id = Column(Integer, nullable=False)  
     material_name = Column(String(200))
-    added_at = Column(DateTime, default=func.now())
+    # datetime.utcnow, а не func.now(): в SQLite CURRENT_TIMESTAMP без микросекунд,
+    # и курсор страницы (с микросекундами) не совпал бы с сохранённым значением
+    added_at = Column(DateTime, default=datetime.utcnow)
     
-    user = relationship("User", back_populates="bookmarks")
\ No newline at end of file
+    user = relationship("User", back_populates="bookmarks")
+
+class XPEvent(Base):
+    """Журнал начислений опыта (только добавление)"""
+    __tablename__ = "xp_events"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    amount = Column(Integer, nullable=False)
+    reason = Column(String(50))
+    created_at = Column(DateTime, default=func.now())
+
+class LessonCompletion(Base):
+    """Уроки, за которые уже начислен опыт (не сбрасывается при перезапуске курса)"""
+    __tablename__ = "lesson_completions"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    material_id = Column(Integer, primary_key=True)
+    completed_at = Column(DateTime, default=func.now())
+
+class Setting(Base):
+    """Служебные значения бота (ключ - значение)"""
+    __tablename__ = "settings"
+    key = Column(String(50), primary_key=True)
+    value = Column(Text)
+
+class SchedulerLock(Base):
+    """Аренда лидерства планировщика (для БД без advisory lock, например SQLite)"""
+    __tablename__ = "scheduler_locks"
+    name = Column(String(50), primary_key=True)
+    owner = Column(String(100), nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+class DailyActivity(Base):
+    """Факт активности пользователя за день (одна строка на пользователя в день)"""
+    __tablename__ = "daily_activity"
+    day = Column(Date, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+
+class ActivityRollup(Base):
+    """Дневной итог активности: DAU и скользящие WAU/MAU на этот день"""
+    __tablename__ = "activity_rollups"
+    day = Column(Date, primary_key=True)
+    dau = Column(Integer, default=0)
+    wau = Column(Integer, default=0)
+    mau = Column(Integer, default=0)
+    new_users = Column(Integer, default=0)
+    # Итоги по всей базе на момент последней свёртки дня (для админ-статистики)
+    total_users = Column(Integer)
+    avg_xp = Column(Float)
+    active_learners = Column(Integer)
+    bookmarks = Column(Integer)
+
+class CohortRetention(Base):
+    """Удержание: сколько пользователей недели регистрации активны через week_offset недель"""
+    __tablename__ = "cohort_retention"
+    cohort_week = Column(Date, primary_key=True)  # понедельник недели регистрации
+    week_offset = Column(Integer, primary_key=True)
+    cohort_size = Column(Integer, default=0)
+    active_users = Column(Integer, default=0)
+
+class FSMRecord(Base):
+    """Состояние FSM пользователя (для FSM_STORAGE=sql)"""
+    __tablename__ = "fsm_states"
+    key = Column(String(255), primary_key=True)
+    state = Column(String(255))
+    data = Column(JSON, default=dict)
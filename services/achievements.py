@@ -1,53 +1,108 @@
 from sqlalchemy import select
-from models import Achievement, UserAchievement, User
+from models import Achievement, UserAchievement, User, Setting
 from sqlalchemy.ext.asyncio import AsyncSession
+from database import dialect_insert
+from utils.json_db import json_db
+from bisect import bisect_right
+import hashlib
+import json
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-async def check_and_give_achievement(db: AsyncSession, user_id: int, code: str):
+# Каталог достижений: code -> данные. Загружается из БД один раз на процесс
+_catalog = None
+
+
+async def load_achievement_catalog(db: AsyncSession, force: bool = False):
     """
-    Проверяет и выдаёт достижение пользователю, если его ещё нет
+    Возвращает каталог достижений, при первом вызове загружая его одним запросом
     """
-    try:
-        # Находим достижение по коду
-        result = await db.execute(select(Achievement).where(Achievement.code == code))
-        ach = result.scalar_one_or_none()
-        
-        if not ach:
-            logger.warning(f"Достижение с кодом {code} не найдено")
-            return None
-        
-        # Проверяем, есть ли уже такое достижение у пользователя
-        result = await db.execute(
-            select(UserAchievement).where(
-                UserAchievement.user_id == user_id,
-                UserAchievement.achievement_id == ach.id
-            )
-        )
-        exists = result.scalar_one_or_none()
-        
-        if not exists:
-            # Выдаём достижение
-            new_ach = UserAchievement(user_id=user_id, achievement_id=ach.id)
-            db.add(new_ach)
-            await db.commit()
-            
-            logger.info(f"🏆 Пользователь {user_id} получил достижение: {ach.name}")
-            
-            # Возвращаем информацию о достижении для уведомления
-            return {
+    global _catalog
+    if _catalog is None or force:
+        result = await db.execute(select(Achievement))
+        _catalog = {
+            ach.code: {
+                "id": ach.id,
                 "name": ach.name,
                 "description": ach.description,
                 "icon": ach.icon or "🏆"
             }
-        
-        return None  # Уже есть такое достижение
-        
-    except Exception as e:
-        logger.error(f"Ошибка при выдаче достижения: {e}")
-        return None
+            for ach in result.scalars().all()
+        }
+    return _catalog
+
+
+async def award_achievements(db: AsyncSession, user_id: int, codes):
+    """
+    Выдаёт пользователю достижения из codes, которых у него ещё нет.
+    Один запрос на уже полученные, один INSERT ... ON CONFLICT DO NOTHING
+    и один commit - независимо от количества достижений.
+    Возвращает список новых достижений для уведомления
+    """
+    if not codes:
+        return []
+
+    try:
+        catalog = await load_achievement_catalog(db)
+
+        candidates = {}
+        for code in codes:
+            ach = catalog.get(code)
+            if ach:
+                candidates[ach["id"]] = ach
+            else:
+                logger.warning(f"Достижение с кодом {code} не найдено")
+        if not candidates:
+            return []
+
+        # Проверяем, какие из них у пользователя уже есть
+        unlocked = await db.execute(
+            select(UserAchievement.achievement_id).where(
+                UserAchievement.user_id == user_id,
+                UserAchievement.achievement_id.in_(candidates.keys())
+            )
+        )
+        missing = set(candidates) - set(unlocked.scalars().all())
+        if not missing:
+            return []
+
+        # ON CONFLICT защищает от гонки двух параллельных проверок
+        inserted = await db.execute(
+            dialect_insert(UserAchievement)
+            .values([{"user_id": user_id, "achievement_id": ach_id} for ach_id in missing])
+            .on_conflict_do_nothing(index_elements=["user_id", "achievement_id"])
+            .returning(UserAchievement.achievement_id)
+        )
+        inserted = inserted.scalars().all()
+        await db.commit()
+
+        new_achievements = []
+        for ach_id in inserted:
+            ach = candidates[ach_id]
+            logger.info(f"🏆 Пользователь {user_id} получил достижение: {ach['name']}")
+            new_achievements.append({
+                "name": ach["name"],
+                "description": ach["description"],
+                "icon": ach["icon"]
+            })
+        return new_achievements
+
+    except Exception:
+        # Не глушим: пустой список выглядел бы как "новых достижений нет",
+        # и выдача тихо перестала бы работать (например, без миграции 0002)
+        logger.exception(f"❌ Ошибка при выдаче достижений пользователю {user_id}")
+        await db.rollback()
+        raise
+
+
+async def check_and_give_achievement(db: AsyncSession, user_id: int, code: str):
+    """
+    Проверяет и выдаёт достижение пользователю, если его ещё нет
+    """
+    new_achievements = await award_achievements(db, user_id, [code])
+    return new_achievements[0] if new_achievements else None
 
 
 async def get_user_achievements(db: AsyncSession, user_id: int):
@@ -67,101 +122,127 @@ async def get_user_achievements(db: AsyncSession, user_id: int):
         return []
 
 
+class AchievementRules:
+    """
+    Правила достижений, скомпилированные в отсортированные пороги по метрикам.
+    Поиск пересечённых порогов - бинарный (bisect), без перебора всех правил
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        by_metric = {}
+        for rule in rules:
+            by_metric.setdefault(rule["metric"], []).append((rule["threshold"], rule["code"]))
+
+        self.thresholds = {}
+        self.codes = {}
+        for metric, items in by_metric.items():
+            items.sort()
+            self.thresholds[metric] = [threshold for threshold, _ in items]
+            self.codes[metric] = [code for _, code in items]
+
+    def reached(self, metric: str, value: int, previous: int = None):
+        """
+        Коды достижений метрики с порогом <= value.
+        Если известно предыдущее значение - только пересечённые сейчас: previous < порог <= value
+        """
+        thresholds = self.thresholds.get(metric)
+        if not thresholds:
+            return []
+        hi = bisect_right(thresholds, value)
+        lo = bisect_right(thresholds, previous) if previous is not None else 0
+        return self.codes[metric][lo:hi]
+
+
+_rules = None
+
+CATALOG_HASH_KEY = "achievements_catalog_hash"
+
+
+def get_achievement_rules(reload: bool = False) -> AchievementRules:
+    """Скомпилированные правила из data/achievements.json"""
+    global _rules
+    if _rules is None or reload:
+        _rules = AchievementRules(json_db.get_achievement_rules())
+    return _rules
+
+
+async def check_metric_achievements(db: AsyncSession, user_id: int, metric: str, value: int, previous: int = None):
+    """
+    Проверяет достижения метрики (lessons, courses, streak, ...).
+    Если previous передан и ни один порог не пересечён - к БД не обращается
+    """
+    codes = get_achievement_rules().reached(metric, value, previous)
+    return await award_achievements(db, user_id, codes)
+
+
 async def check_lesson_achievements(db: AsyncSession, user_id: int, lesson_count: int):
     """
     Проверяет достижения, связанные с количеством уроков
     """
-    achievements_to_check = []
-    
-    if lesson_count >= 1:
-        achievements_to_check.append("first_lesson")
-    if lesson_count >= 10:
-        achievements_to_check.append("10_lessons")
-    if lesson_count >= 50:
-        achievements_to_check.append("50_lessons")
-    if lesson_count >= 100:
-        achievements_to_check.append("100_lessons")
-    
-    new_achievements = []
-    for code in achievements_to_check:
-        result = await check_and_give_achievement(db, user_id, code)
-        if result:
-            new_achievements.append(result)
-    
-    return new_achievements
+    return await check_metric_achievements(db, user_id, "lessons", lesson_count)
 
 
 async def check_course_achievements(db: AsyncSession, user_id: int, course_count: int):
     """
     Проверяет достижения, связанные с количеством курсов
     """
-    achievements_to_check = []
-    
-    if course_count >= 1:
-        achievements_to_check.append("first_course")
-    if course_count >= 5:
-        achievements_to_check.append("5_courses")
-    if course_count >= 10:
-        achievements_to_check.append("10_courses")
-    
-    new_achievements = []
-    for code in achievements_to_check:
-        result = await check_and_give_achievement(db, user_id, code)
-        if result:
-            new_achievements.append(result)
-    
-    return new_achievements
+    return await check_metric_achievements(db, user_id, "courses", course_count)
 
 
 async def check_streak_achievements(db: AsyncSession, user_id: int, streak_days: int):
     """
     Проверяет достижения, связанные с непрерывными днями обучения
     """
-    achievements_to_check = []
-    
-    if streak_days >= 3:
-        achievements_to_check.append("streak_3")
-    if streak_days >= 7:
-        achievements_to_check.append("streak_7")
-    if streak_days >= 30:
-        achievements_to_check.append("streak_30")
-    
-    new_achievements = []
-    for code in achievements_to_check:
-        result = await check_and_give_achievement(db, user_id, code)
-        if result:
-            new_achievements.append(result)
-    
-    return new_achievements
+    return await check_metric_achievements(db, user_id, "streak", streak_days)
+
+
+def _catalog_hash(rules) -> str:
+    """Хэш описаний достижений - меняется только при правке каталога"""
+    payload = [
+        {"code": r["code"], "name": r["name"], "description": r.get("description"), "icon": r.get("icon", "🏆")}
+        for r in rules
+    ]
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode()).hexdigest()
 
 
 async def initialize_achievements(db: AsyncSession):
     """
-    Инициализирует базовые достижения в БД (если их нет)
-    """
-    achievements = [
-        {"code": "first_lesson", "name": "Первый урок!", "description": "Изучил первый урок", "icon": "📚"},
-        {"code": "10_lessons", "name": "10 уроков", "description": "Изучил 10 уроков", "icon": "📖"},
-        {"code": "50_lessons", "name": "50 уроков", "description": "Изучил 50 уроков", "icon": "📕"},
-        {"code": "100_lessons", "name": "100 уроков", "description": "Изучил 100 уроков", "icon": "📗"},
-        
-        {"code": "first_course", "name": "Первый курс!", "description": "Завершил первый курс", "icon": "🎓"},
-        {"code": "5_courses", "name": "5 курсов", "description": "Завершил 5 курсов", "icon": "🏅"},
-        {"code": "10_courses", "name": "10 курсов", "description": "Завершил 10 курсов", "icon": "🏆"},
-        
-        {"code": "streak_3", "name": "3 дня подряд", "description": "Учился 3 дня подряд", "icon": "🔥"},
-        {"code": "streak_7", "name": "7 дней подряд", "description": "Учился 7 дней подряд", "icon": "⚡"},
-        {"code": "streak_30", "name": "30 дней подряд", "description": "Учился месяц без перерыва", "icon": "💫"},
-    ]
+    Синхронизирует достижения из data/achievements.json с БД.
+    Если каталог не менялся (хэш совпадает) - ничего не пишет.
+    Иначе - один bulk upsert по Achievement.code, безопасный
+    при одновременном запуске нескольких процессов
+    """
+    rules = get_achievement_rules(reload=True)
+    catalog_hash = _catalog_hash(rules.rules)
+    
+    stored = await db.get(Setting, CATALOG_HASH_KEY)
+    if stored and stored.value == catalog_hash:
+        logger.info("✅ Достижения актуальны")
+        return
+    
+    if rules.rules:
+        stmt = dialect_insert(Achievement).values([
+            {
+                "code": rule["code"],
+                "name": rule["name"],
+                "description": rule.get("description"),
+                "icon": rule.get("icon", "🏆")
+            }
+            for rule in rules.rules
+        ])
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=["code"],
+            set_={
+                "name": stmt.excluded.name,
+                "description": stmt.excluded.description,
+                "icon": stmt.excluded.icon
+            }
+        ))
     
-    for ach_data in achievements:
-        # Проверяем, есть ли уже такое достижение
-        result = await db.execute(select(Achievement).where(Achievement.code == ach_data["code"]))
-        existing = result.scalar_one_or_none()
-        
-        if not existing:
-            ach = Achievement(**ach_data)
-            db.add(ach)
+    stmt = dialect_insert(Setting).values(key=CATALOG_HASH_KEY, value=catalog_hash)
+    await db.execute(stmt.on_conflict_do_update(index_elements=["key"], set_={"value": stmt.excluded.value}))
     
     await db.commit()
+    await load_achievement_catalog(db, force=True)
     logger.info("✅ Достижения инициализированы")
\ No newline at end of file
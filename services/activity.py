@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import os
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import select, update, case, func, literal, Date
+from database import AsyncSessionLocal, dialect_insert
+from models import User, UserProgress, Bookmark, DailyActivity, ActivityRollup, CohortRetention
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ACTIVITY_FLUSH_SECONDS = float(os.getenv("ACTIVITY_FLUSH_SECONDS", "10"))
+# last_active одного пользователя обновляется не чаще раза в этот интервал
+LAST_SEEN_INTERVAL_SECONDS = float(os.getenv("LAST_SEEN_INTERVAL_SECONDS", "60"))
+# Сколько недельных когорт пересчитывается и показывается в отчёте
+RETENTION_WEEKS = 8
+
+
+def week_start(day: date) -> date:
+    """Понедельник недели, в которую попадает день"""
+    return day - timedelta(days=day.weekday())
+
+
+def _day_start(day: date) -> datetime:
+    return datetime.combine(day, time.min)
+
+
+def database_totals():
+    """
+    Итоги по всей базе для админ-статистики. Это полные проходы по таблицам,
+    поэтому их считает только почасовая свёртка, а не экран статистики
+    """
+    return (
+        select(func.count(User.id)).scalar_subquery().label("total_users"),
+        select(func.avg(User.xp)).scalar_subquery().label("avg_xp"),
+        select(func.count(func.distinct(UserProgress.user_id))).scalar_subquery().label("active_learners"),
+        select(func.count(Bookmark.id)).scalar_subquery().label("bookmarks"),
+    )
+
+
+class ActivityTracker:
+    """
+    Буфер активности в памяти процесса.
+    Пользователь попадает в буфер дневной активности не чаще раза в день:
+    уже учтённые за текущий день tg_id хранятся в множестве. Время последнего
+    визита (users.last_active) копится так же и пишется одним UPDATE,
+    не чаще раза в LAST_SEEN_INTERVAL_SECONDS на пользователя.
+    Буфер периодически сбрасывается в БД
+    """
+
+    def __init__(self):
+        self._day = None
+        self._seen = set()  # tg_id, уже учтённые за текущий день
+        self._pending = {}  # день -> множество tg_id
+        self._last_seen = {}  # tg_id -> время визита, ещё не записанное в БД
+        self._touched = {}  # tg_id -> когда last_active последний раз ставился в буфер
+        self._lock = asyncio.Lock()
+        self._task = None
+
+    def record(self, tg_id: int, now: datetime = None):
+        """Отметить активность пользователя (без обращения к БД)"""
+        now = now or datetime.utcnow()
+        touched = self._touched.get(tg_id)
+        if touched is None or (now - touched).total_seconds() >= LAST_SEEN_INTERVAL_SECONDS:
+            self._touched[tg_id] = now
+            self._last_seen[tg_id] = now
+        
+        day = now.date()
+        if day != self._day:
+            self._day = day
+            self._seen = set()
+        if tg_id in self._seen:
+            return
+        self._seen.add(tg_id)
+        self._pending.setdefault(day, set()).add(tg_id)
+
+    async def flush(self):
+        """Записывает накопленную активность в БД"""
+        async with self._lock:
+            self._prune_touched()
+            if not self._pending and not self._last_seen:
+                return
+            pending, self._pending = self._pending, {}
+            last_seen, self._last_seen = self._last_seen, {}
+
+            try:
+                async with AsyncSessionLocal() as db:
+                    if last_seen:
+                        await db.execute(
+                            update(User)
+                            .where(User.tg_id.in_(last_seen.keys()))
+                            .values(last_active=case(last_seen, value=User.tg_id))
+                        )
+                    for day, tg_ids in pending.items():
+                        # id пользователей берутся из users тем же запросом;
+                        # незарегистрированные tg_id просто не попадут в выборку
+                        stmt = dialect_insert(DailyActivity).from_select(
+                            ["day", "user_id"],
+                            select(literal(day, type_=Date), User.id).where(User.tg_id.in_(tg_ids))
+                        )
+                        await db.execute(stmt.on_conflict_do_nothing(index_elements=["day", "user_id"]))
+                    await db.commit()
+            except Exception as e:
+                logger.error(f"❌ Ошибка записи активности: {e}")
+                for day, tg_ids in pending.items():
+                    self._pending.setdefault(day, set()).update(tg_ids)
+                for tg_id, seen_at in last_seen.items():
+                    self._last_seen.setdefault(tg_id, seen_at)
+
+    def _prune_touched(self):
+        """Забывает пользователей, у которых интервал уже истёк - словарь не растёт бесконечно"""
+        cutoff = datetime.utcnow() - timedelta(seconds=LAST_SEEN_INTERVAL_SECONDS)
+        self._touched = {tg_id: at for tg_id, at in self._touched.items() if at > cutoff}
+
+    def start(self):
+        """Запускает периодический сброс"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Останавливает сброс и записывает остаток"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(ACTIVITY_FLUSH_SECONDS)
+            await self.flush()
+
+
+async def rollup_activity(db, day: date):
+    """
+    Пересчитывает итоги за день: DAU/WAU/MAU, новых пользователей
+    и удержание когорт за неделю, в которую попадает день.
+    Для текущего дня также обновляет итоги по всей базе (database_totals).
+    Идемпотентна - её можно запускать повторно в течение дня
+    """
+    def active_since(days: int):
+        return (
+            select(func.count(func.distinct(DailyActivity.user_id)))
+            .where(DailyActivity.day > day - timedelta(days=days), DailyActivity.day <= day)
+            .scalar_subquery()
+        )
+
+    row = await db.execute(
+        select(
+            active_since(1).label("dau"),
+            active_since(7).label("wau"),
+            active_since(30).label("mau"),
+            select(func.count(User.id))
+            .where(User.registered_at >= _day_start(day), User.registered_at < _day_start(day + timedelta(days=1)))
+            .scalar_subquery().label("new_users"),
+            # Прошедшие дни сохраняют итоги по базе на момент своей последней свёртки
+            *(database_totals() if day >= datetime.utcnow().date() else ())
+        )
+    )
+    totals = dict(row.one()._mapping)
+    stmt = dialect_insert(ActivityRollup).values(day=day, **totals)
+    await db.execute(stmt.on_conflict_do_update(index_elements=["day"], set_=totals))
+
+    # Удержание: активные на этой неделе среди зарегистрированных offset недель назад.
+    # Все когорты считаются одним запросом из скалярных подзапросов
+    current_week = week_start(day)
+    week_from, week_to = _day_start(current_week), _day_start(current_week + timedelta(days=7))
+    columns = []
+    for offset in range(RETENTION_WEEKS):
+        cohort = current_week - timedelta(weeks=offset)
+        in_cohort = (
+            User.registered_at >= _day_start(cohort),
+            User.registered_at < _day_start(cohort + timedelta(days=7))
+        )
+        columns.append(select(func.count(User.id)).where(*in_cohort).scalar_subquery())
+        columns.append(
+            select(func.count(func.distinct(DailyActivity.user_id)))
+            .join(User, User.id == DailyActivity.user_id)
+            .where(*in_cohort, DailyActivity.day >= week_from.date(), DailyActivity.day < week_to.date())
+            .scalar_subquery()
+        )
+    counts = (await db.execute(select(*columns))).one()
+
+    for offset in range(RETENTION_WEEKS):
+        cohort_size, active_users = counts[2 * offset] or 0, counts[2 * offset + 1] or 0
+        if not cohort_size:
+            continue
+        values = {"cohort_size": cohort_size, "active_users": active_users}
+        stmt = dialect_insert(CohortRetention).values(
+            cohort_week=current_week - timedelta(weeks=offset), week_offset=offset, **values
+        )
+        await db.execute(stmt.on_conflict_do_update(index_elements=["cohort_week", "week_offset"], set_=values))
+
+    await db.commit()
+
+
+async def get_activity_report(db, days: int = 7) -> dict:
+    """Готовые итоги для админ-отчёта (только чтение свёрток)"""
+    rollups = await db.execute(select(ActivityRollup).order_by(ActivityRollup.day.desc()).limit(days))
+    rollups = rollups.scalars().all()
+
+    since = week_start(datetime.utcnow().date()) - timedelta(weeks=RETENTION_WEEKS - 1)
+    cohorts = await db.execute(
+        select(CohortRetention)
+        .where(CohortRetention.cohort_week >= since)
+        .order_by(CohortRetention.cohort_week.desc(), CohortRetention.week_offset)
+    )
+    retention = {}
+    for row in cohorts.scalars().all():
+        retention.setdefault(row.cohort_week, {})[row.week_offset] = (row.active_users, row.cohort_size)
+
+    return {"rollups": rollups, "retention": retention}
+
+
+activity_tracker = ActivityTracker()
@@ -0,0 +1,235 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional, Tuple
+from aiogram import Bot
+from sqlalchemy import select, update, or_
+from database import AsyncSessionLocal
+from models import Broadcast, User
+from keyboards import get_broadcast_keyboard
+from services.delivery import try_send
+from services.outbound import bulk_priority
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Служебный чат для режима копирования (если не задан - чат администратора)
+STAGING_CHAT_ID = int(os.getenv("BROADCAST_STAGING_CHAT_ID", "0")) or None
+BATCH_SIZE = 500
+# Аренда рассылки продлевается перед каждой пачкой; брошенную (процесс упал)
+# рассылку после истечения аренды подхватывает другой процесс
+BROADCAST_LEASE_SECONDS = int(os.getenv("BROADCAST_LEASE_SECONDS", "300"))
+OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+MODE_SEND = "send"
+MODE_COPY = "copy"
+
+# Ссылки на фоновые задачи, чтобы их не собрал сборщик мусора
+_background_tasks = set()
+# Рассылки, которые ведёт этот процесс
+_active = set()
+
+
+def _caption(broadcast: Broadcast) -> str:
+    return f"📢 <b>{broadcast.name}</b>\n\n{broadcast.description or ''}"
+
+
+def _keyboard(broadcast: Broadcast):
+    return get_broadcast_keyboard({
+        "button_text": broadcast.button_text,
+        "button_url": broadcast.button_url
+    })
+
+
+async def send_broadcast_message(bot: Bot, chat_id: int, broadcast: Broadcast):
+    """Отправляет рассылку заново: file_id + подпись + клавиатура"""
+    content = broadcast.content or {}
+    reply_markup = _keyboard(broadcast)
+
+    if broadcast.content_type == "text":
+        return await bot.send_message(
+            chat_id,
+            f"{_caption(broadcast)}\n\n{content.get('text', '')}",
+            parse_mode="HTML",
+            reply_markup=reply_markup
+        )
+    if broadcast.content_type == "photo":
+        return await bot.send_photo(
+            chat_id, content['file_id'], caption=_caption(broadcast),
+            parse_mode="HTML", reply_markup=reply_markup
+        )
+    if broadcast.content_type == "video":
+        return await bot.send_video(
+            chat_id, content['file_id'], caption=_caption(broadcast),
+            parse_mode="HTML", reply_markup=reply_markup
+        )
+    if broadcast.content_type == "document":
+        return await bot.send_document(
+            chat_id, content['file_id'], caption=_caption(broadcast),
+            parse_mode="HTML", reply_markup=reply_markup
+        )
+    raise ValueError(f"Неизвестный тип рассылки: {broadcast.content_type}")
+
+
+async def stage_broadcast(bot: Bot, broadcast: Broadcast, fallback_chat_id: int):
+    """
+    Публикует рассылку один раз в служебный чат,
+    откуда она затем копируется получателям
+    """
+    chat_id = STAGING_CHAT_ID or fallback_chat_id
+    staged = await send_broadcast_message(bot, chat_id, broadcast)
+    broadcast.staging_chat_id = chat_id
+    broadcast.staging_message_id = staged.message_id
+
+
+def _build_sender(bot: Bot, broadcast: Broadcast):
+    if broadcast.mode == MODE_COPY:
+        # copyMessage не передаёт файл и подпись заново - сервер берёт их из исходного сообщения.
+        # Пакетный copyMessages работает только "много сообщений -> один чат",
+        # поэтому для рассылки одного сообщения используется одиночный вызов.
+        from_chat_id = broadcast.staging_chat_id
+        message_id = broadcast.staging_message_id
+        reply_markup = _keyboard(broadcast)
+
+        def sender(chat_id: int):
+            return bot.copy_message(chat_id, from_chat_id, message_id, reply_markup=reply_markup)
+    else:
+        def sender(chat_id: int):
+            return send_broadcast_message(bot, chat_id, broadcast)
+
+    return sender
+
+
+async def claim_broadcast(db, broadcast_id: int) -> bool:
+    """
+    Атомарно забирает (или продлевает) аренду незавершённой рассылки:
+    свою, ничью или с истёкшей арендой. True - рассылку ведёт этот процесс
+    """
+    now = datetime.utcnow()
+    result = await db.execute(
+        update(Broadcast)
+        .where(
+            Broadcast.id == broadcast_id,
+            Broadcast.status == "running",
+            or_(Broadcast.owner.is_(None), Broadcast.owner == OWNER, Broadcast.lease_expires_at < now)
+        )
+        .values(owner=OWNER, lease_expires_at=now + timedelta(seconds=BROADCAST_LEASE_SECONDS))
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return bool(result.rowcount)
+
+
+async def run_broadcast(
+    bot: Bot,
+    broadcast_id: int,
+    on_progress: Callable[[int, int], Awaitable] = None
+) -> Optional[Tuple[int, int]]:
+    """
+    Рассылает сообщение всем пользователям пачками по users.id.
+    После каждой пачки курсор сохраняется в БД, поэтому прерванную
+    рассылку можно продолжить с места остановки.
+    on_progress(отправлено, ошибок) вызывается после каждой пачки.
+    Возвращает (отправлено, ошибок) или None, если рассылку ведёт другой процесс
+    """
+    if broadcast_id in _active:
+        return None
+    _active.add(broadcast_id)
+    try:
+        return await _run_claimed(bot, broadcast_id, on_progress)
+    finally:
+        _active.discard(broadcast_id)
+
+
+async def _run_claimed(bot: Bot, broadcast_id: int, on_progress):
+    async with AsyncSessionLocal() as db:
+        if not await claim_broadcast(db, broadcast_id):
+            logger.info(f"Рассылку {broadcast_id} ведёт другой процесс или она завершена")
+            return None
+
+        broadcast = await db.get(Broadcast, broadcast_id)
+        if not broadcast or broadcast.status != "running":
+            return 0, 0
+
+        if broadcast.mode == MODE_COPY and not broadcast.staging_message_id:
+            logger.error(f"Рассылка {broadcast_id} в режиме копирования не опубликована в служебный чат")
+            broadcast.status = "failed"
+            await db.commit()
+            return 0, 0
+
+        send = _build_sender(bot, broadcast)
+
+        while True:
+            rows = await db.execute(
+                select(User.id, User.tg_id)
+                .where(User.id > (broadcast.cursor_user_id or 0))
+                .order_by(User.id)
+                .limit(BATCH_SIZE)
+            )
+            rows = rows.all()
+            if not rows:
+                break
+
+            if not await claim_broadcast(db, broadcast_id):
+                logger.warning(f"⚠️ Аренда рассылки {broadcast_id} перешла другому процессу, останавливаемся")
+                return None
+
+            sent = 0
+            failed = 0
+            with bulk_priority():
+                for _, tg_id in rows:
+                    if await try_send(lambda: send(tg_id), tg_id):
+                        sent += 1
+                    else:
+                        failed += 1
+
+            broadcast.cursor_user_id = rows[-1].id
+            broadcast.sent_count = (broadcast.sent_count or 0) + sent
+            broadcast.failed_count = (broadcast.failed_count or 0) + failed
+            await db.commit()
+
+            if on_progress:
+                try:
+                    await on_progress(broadcast.sent_count, broadcast.failed_count)
+                except Exception as e:
+                    logger.warning(f"Не удалось сообщить прогресс рассылки {broadcast_id}: {e}")
+
+        broadcast.status = "done"
+        await db.commit()
+
+        logger.info(
+            f"✅ Рассылка {broadcast_id} ({broadcast.mode}) завершена: "
+            f"{broadcast.sent_count} успешно, {broadcast.failed_count} с ошибками"
+        )
+        return broadcast.sent_count, broadcast.failed_count
+
+
+def start_in_background(coro: Awaitable) -> asyncio.Task:
+    """Запускает рассылку фоновой задачей, не дожидаясь её окончания"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+async def resume_broadcasts(bot: Bot):
+    """
+    Продолжает брошенные рассылки (процесс, который их вёл, остановился
+    или упал и не продлевает аренду). Забирает их run_broadcast атомарно,
+    поэтому несколько реплик не отправят одну рассылку дважды
+    """
+    async with AsyncSessionLocal() as db:
+        unfinished = await db.execute(
+            select(Broadcast.id).where(
+                Broadcast.status == "running",
+                or_(Broadcast.owner.is_(None), Broadcast.lease_expires_at < datetime.utcnow())
+            )
+        )
+        unfinished = [broadcast_id for broadcast_id in unfinished.scalars().all() if broadcast_id not in _active]
+
+    for broadcast_id in unfinished:
+        logger.info(f"🔁 Продолжаем рассылку {broadcast_id}")
+        start_in_background(run_broadcast(bot, broadcast_id))
@@ -0,0 +1,64 @@
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable
+
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError
+
+from services.outbound import bulk_priority
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Сколько отправок выполняется одновременно в пуле воркеров.
+# Частоту и повторы после флуд-контроля (429) обеспечивает сессия бота (services/outbound.py)
+DELIVERY_WORKERS = int(os.getenv("DELIVERY_WORKERS", "4"))
+
+
+async def try_send(send: Callable[[], Awaitable], chat_id: int) -> bool:
+    """
+    Выполняет одну отправку массовой задачи.
+    Возвращает True, если сообщение доставлено
+    """
+    try:
+        await send()
+        return True
+    except TelegramForbiddenError:
+        # Пользователь заблокировал бота - повторять бессмысленно
+        return False
+    except TelegramRetryAfter as e:
+        # Сессия уже повторила запрос OUTBOUND_MAX_RETRIES раз
+        logger.error(f"Не удалось отправить сообщение {chat_id}: флуд-контроль не снят ({e.retry_after} с)")
+        return False
+    except Exception as e:
+        logger.error(f"Не удалось отправить сообщение {chat_id}: {e}")
+        return False
+
+
+async def deliver(jobs, workers: int = DELIVERY_WORKERS):
+    """
+    Доставляет пачку сообщений пулом воркеров.
+    jobs - список пар (chat_id, send), где send() создаёт корутину отправки.
+    Возвращает (отправлено, ошибок)
+    """
+    queue = asyncio.Queue()
+    for job in jobs:
+        queue.put_nowait(job)
+
+    stats = {"sent": 0, "failed": 0}
+
+    async def worker():
+        while True:
+            try:
+                chat_id, send = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            if await try_send(send, chat_id):
+                stats["sent"] += 1
+            else:
+                stats["failed"] += 1
+
+    # Задачи воркеров наследуют низкий приоритет - ответы пользователям идут вперёд
+    with bulk_priority():
+        await asyncio.gather(*(worker() for _ in range(max(1, min(workers, queue.qsize())))))
+    return stats["sent"], stats["failed"]
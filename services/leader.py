@@ -0,0 +1,120 @@
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import text, update
+from sqlalchemy.exc import IntegrityError
+from database import engine, AsyncSessionLocal
+from models import SchedulerLock
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Через сколько секунд чужая аренда считается брошенной (только для lock-таблицы)
+LEADER_LEASE_SECONDS = int(os.getenv("LEADER_LEASE_SECONDS", "60"))
+
+
+class LeaderLock:
+    """
+    Выбор единственного лидера среди реплик бота.
+    PostgreSQL: сессионный pg_try_advisory_lock на выделенном соединении -
+    блокировка снимается сама, если процесс умер.
+    Остальные БД: строка в scheduler_locks с арендой, которую лидер продлевает
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.key = int.from_bytes(name.encode()[:8].ljust(8, b"\0"), "big") & 0x7FFFFFFFFFFFFFFF
+        self._conn = None
+
+    @property
+    def _advisory(self) -> bool:
+        return engine.dialect.name == "postgresql"
+
+    async def acquire(self) -> bool:
+        """Пытается стать лидером. True - блокировка наша"""
+        if self._advisory:
+            return await self._acquire_advisory()
+        return await self._acquire_lease()
+
+    async def refresh(self) -> bool:
+        """Подтверждает лидерство. False - блокировка потеряна"""
+        if self._advisory:
+            try:
+                await self._conn.execute(text("SELECT 1"))
+                await self._conn.commit()
+                return True
+            except Exception as e:
+                logger.error(f"Соединение с advisory lock потеряно: {e}")
+                await self._close()
+                return False
+        return await self._acquire_lease()
+
+    async def release(self):
+        """Отдаёт лидерство (при остановке бота)"""
+        try:
+            if self._advisory:
+                if self._conn is not None:
+                    await self._conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": self.key})
+                    await self._conn.commit()
+                    await self._close()
+                return
+
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(SchedulerLock)
+                    .where(SchedulerLock.name == self.name, SchedulerLock.owner == self.owner)
+                    .values(expires_at=datetime.utcnow())
+                )
+                await db.commit()
+        except Exception as e:
+            logger.error(f"Ошибка при освобождении блокировки {self.name}: {e}")
+
+    async def _acquire_advisory(self) -> bool:
+        if self._conn is None:
+            self._conn = await engine.connect()
+        try:
+            result = await self._conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": self.key})
+            acquired = bool(result.scalar())
+            await self._conn.commit()
+        except Exception:
+            await self._close()
+            raise
+        if not acquired:
+            await self._close()
+        return acquired
+
+    async def _acquire_lease(self) -> bool:
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=LEADER_LEASE_SECONDS)
+        async with AsyncSessionLocal() as db:
+            # Продлеваем свою аренду или забираем просроченную чужую
+            result = await db.execute(
+                update(SchedulerLock)
+                .where(
+                    SchedulerLock.name == self.name,
+                    (SchedulerLock.owner == self.owner) | (SchedulerLock.expires_at < now)
+                )
+                .values(owner=self.owner, expires_at=expires_at)
+            )
+            if result.rowcount:
+                await db.commit()
+                return True
+
+            db.add(SchedulerLock(name=self.name, owner=self.owner, expires_at=expires_at))
+            try:
+                await db.commit()
+                return True
+            except IntegrityError:
+                # Строка уже есть и аренда действует - лидер другой процесс
+                await db.rollback()
+                return False
+
+    async def _close(self):
+        if self._conn is not None:
+            try:
+                await self._conn.close()
+            finally:
+                self._conn = None
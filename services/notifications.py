@@ -1,42 +1,145 @@
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from aiogram import Bot
-from utils.helpers import get_random_tip
+from utils.helpers import get_tip_for_user, get_user_timezone
+from utils.json_db import json_db
 from models import User, UserProgress
-from sqlalchemy import select
+from services.delivery import deliver
+from sqlalchemy import select, update, func, case, and_, or_, true, false
+from functools import partial
+from typing import Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 import logging
-from datetime import datetime, timedelta
+import os
+from datetime import datetime, timedelta, timezone
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-async def send_daily_tip(bot: Bot, db):
+# Окно рассылки советов дня по местному времени пользователя
+DAILY_TIP_HOUR = int(os.getenv("DAILY_TIP_HOUR", "9"))
+DAILY_TIP_WINDOW_MINUTES = int(os.getenv("DAILY_TIP_WINDOW_MINUTES", "60"))
+# Шаг тика планировщика; должен делить 60 без остатка
+DAILY_TIP_SLOT_MINUTES = int(os.getenv("DAILY_TIP_SLOT_MINUTES", "5"))
+DAILY_TIP_USE_TIMEZONES = os.getenv("DAILY_TIP_USE_TIMEZONES", "1") == "1"
+# Сколько получателей берёт один тик (остальные - в следующих тиках)
+DAILY_TIP_MAX_PER_TICK = int(os.getenv("DAILY_TIP_MAX_PER_TICK", "5000"))
+# Сколько получателей напоминаний и недельной статистики читается из БД за раз
+NOTIFY_BATCH_SIZE = 1000
+
+def daily_tip_shards() -> int:
+    """Количество шардов, на которые делится окно рассылки советов"""
+    return -(-DAILY_TIP_WINDOW_MINUTES // DAILY_TIP_SLOT_MINUTES)
+
+
+def daily_tip_due_shard(local_now: datetime) -> Optional[int]:
+    """
+    Старший шард, чья очередь уже наступила в данный момент местного времени,
+    или None, если окно рассылки ещё не началось. После окна очередь наступила
+    у всех шардов - так пропущенные или опоздавшие тики догоняются в тот же день
+    """
+    minutes = local_now.hour * 60 + local_now.minute - DAILY_TIP_HOUR * 60
+    if minutes < 0:
+        return None
+    return min(minutes // DAILY_TIP_SLOT_MINUTES, daily_tip_shards() - 1)
+
+
+async def _due_tip_condition(db, now: datetime):
+    """
+    Строит условие выборки получателей для текущего тика: очередь шарда
+    пользователя в его часовом поясе наступила, а совет за местный "сегодня"
+    ещё не отправлен. Возвращает (условие, местная дата получателя) или (None, None)
+    """
+    shards = daily_tip_shards()
+    groups = {}  # (шард, местная дата) -> часовые пояса (None - пояс по умолчанию)
+
+    default_now = now.astimezone(get_user_timezone())
+    shard = daily_tip_due_shard(default_now)
+    if shard is not None:
+        groups.setdefault((shard, default_now.date()), []).append(None)
+
+    local_dates = {}  # часовой пояс -> местная дата
+    if DAILY_TIP_USE_TIMEZONES:
+        timezones = await db.execute(select(User.timezone).where(User.timezone.isnot(None)).distinct())
+        for tz_name in timezones.scalars().all():
+            try:
+                local_now = now.astimezone(ZoneInfo(tz_name))
+            except (ZoneInfoNotFoundError, ValueError):
+                logger.warning(f"Неизвестный часовой пояс: {tz_name}")
+                continue
+            shard = daily_tip_due_shard(local_now)
+            if shard is not None:
+                groups.setdefault((shard, local_now.date()), []).append(tz_name)
+                local_dates[tz_name] = local_now.date()
+
+    conditions = []
+    for (shard, today), tz_names in groups.items():
+        if DAILY_TIP_USE_TIMEZONES:
+            named = [tz for tz in tz_names if tz]
+            tz_cond = or_(
+                User.timezone.in_(named),
+                User.timezone.is_(None) if None in tz_names else false()
+            )
+        else:
+            tz_cond = true()
+        conditions.append(and_(
+            tz_cond,
+            User.id % shards <= shard,
+            or_(User.last_tip_date.is_(None), User.last_tip_date < today)
+        ))
+
+    if not conditions:
+        return None, None
+    if local_dates:
+        tip_date = case(local_dates, value=User.timezone, else_=default_now.date())
+    else:
+        tip_date = default_now.date()
+    return or_(*conditions), tip_date
+
+
+async def send_daily_tip(bot: Bot, db, now: Optional[datetime] = None):
     """
-    Отправляет ежедневный совет всем активным пользователям
+    Отправляет ежедневный совет тем активным пользователям, чья очередь уже
+    наступила и кто ещё не получил совет сегодня (по местному времени).
+    Вызывается планировщиком каждые DAILY_TIP_SLOT_MINUTES минут: в окне
+    DAILY_TIP_WINDOW_MINUTES (начиная с DAILY_TIP_HOUR) шарды пользователей
+    открываются по очереди, а пропущенные тики догоняются следующими
     """
     try:
+        now = now or datetime.now(timezone.utc)
+        condition, tip_date = await _due_tip_condition(db, now)
+        if condition is None:
+            return
+        
         # Получаем активных пользователей (заходили за последние 7 дней)
-        week_ago = datetime.now() - timedelta(days=7)
+        week_ago = datetime.utcnow() - timedelta(days=7)
+        due = (
+            select(User.id)
+            .where(User.last_active >= week_ago, condition)
+            .order_by(User.id)
+            .limit(DAILY_TIP_MAX_PER_TICK)
+            .correlate(None)
+        )
+        # Отмечаем получателей до отправки одним UPDATE: тики, идущие одновременно
+        # (в том числе в других процессах), не отправят совет повторно
         users = await db.execute(
-            select(User).where(User.last_active >= week_ago)
+            update(User)
+            .where(User.id.in_(due), condition)
+            .values(last_tip_date=tip_date, tip_offset=func.coalesce(User.tip_offset, 0) + 1)
+            .returning(User.id, User.tg_id, User.tip_offset)
+            .execution_options(synchronize_session=False)
         )
-        users = users.scalars().all()
-        
-        tip = get_random_tip()
+        users = users.all()
+        await db.commit()
+        if not users:
+            return
         
-        sent = 0
-        failed = 0
+        # Каждый получает следующий совет из своей ротации - без повторов, пока пул не исчерпан
+        pool = json_db.get_tip_pool()
+        jobs = []
+        for user_id, tg_id, tip_offset in users:
+            text = f"💡 **Совет дня**\n\n{get_tip_for_user(pool, user_id, tip_offset - 1)}"
+            jobs.append((tg_id, partial(bot.send_message, tg_id, text, parse_mode="HTML")))
         
-        for user in users:
-            try:
-                await bot.send_message(
-                    user.tg_id, 
-                    f"💡 **Совет дня**\n\n{tip}",
-                    parse_mode="HTML"
-                )
-                sent += 1
-            except Exception as e:
-                failed += 1
-                logger.error(f"Не удалось отправить совет пользователю {user.tg_id}: {e}")
+        sent, failed = await deliver(jobs)
         
         logger.info(f"✅ Ежедневные советы отправлены: {sent} успешно, {failed} с ошибками")
         
@@ -44,102 +147,130 @@ async def send_daily_tip(bot: Bot, db):
         logger.error(f"❌ Ошибка при отправке советов: {e}")
 
 
-async def smart_resume(bot: Bot, db, user_id: int = None):
+async def smart_resume(bot: Bot, db, user_id: int = None, idle_days: int = 2):
     """
     Отправляет напоминание о незавершенных уроках
     Если user_id указан - отправляет конкретному пользователю,
-    иначе - всем пользователям с незавершенными курсами
+    иначе - всем, кто не открывал уроки idle_days дней.
+    Напоминаем о последнем незавершённом курсе и один раз за период простоя:
+    время напоминания хранится в last_resume_at, новый период начинается
+    со следующего открытия урока (last_accessed станет позже).
+    Пользователи читаются пачками по users.id
     """
     try:
-        if user_id:
-            # Отправляем конкретному пользователю
-            await send_resume_to_user(bot, db, user_id)
-        else:
-            # Отправляем всем пользователям с незавершенными курсами
-            users_with_progress = await db.execute(
-                select(User)
-                .join(UserProgress)
-                .distinct()
+        subcategory_names = {s['id']: s['name'] for s in json_db.get_subcategories()}
+        cutoff = datetime.utcnow() - timedelta(days=idle_days)
+        sent = failed = 0
+        last_id = 0
+        
+        while True:
+            users = select(User.id).where(User.id > last_id).order_by(User.id).limit(NOTIFY_BATCH_SIZE)
+            if user_id:
+                users = users.where(User.id == user_id)
+            user_ids = (await db.execute(users)).scalars().all()
+            if not user_ids:
+                break
+            last_id = user_ids[-1]
+            
+            # Последний незавершённый курс каждого пользователя пачки (оконная функция)
+            latest = (
+                select(
+                    UserProgress.id,
+                    UserProgress.user_id,
+                    UserProgress.subcategory_id,
+                    UserProgress.current_material_index,
+                    UserProgress.last_accessed,
+                    UserProgress.last_resume_at,
+                    func.row_number().over(
+                        partition_by=UserProgress.user_id,
+                        order_by=(UserProgress.last_accessed.desc(), UserProgress.id.desc())
+                    ).label("rn")
+                )
+                .where(UserProgress.user_id.in_(user_ids), UserProgress.completed_at.is_(None))
+                .subquery()
+            )
+            query = (
+                select(User.tg_id, User.name, latest.c.id, latest.c.subcategory_id, latest.c.current_material_index)
+                .join(latest, latest.c.user_id == User.id)
+                .where(latest.c.rn == 1)
             )
-            users = users_with_progress.scalars().all()
+            if not user_id:
+                query = query.where(
+                    latest.c.last_accessed < cutoff,
+                    or_(latest.c.last_resume_at.is_(None), latest.c.last_resume_at < latest.c.last_accessed)
+                )
             
-            for user in users:
-                await send_resume_to_user(bot, db, user.id)
-                
-    except Exception as e:
-        logger.error(f"❌ Ошибка в smart_resume: {e}")
-
-
-async def send_resume_to_user(bot: Bot, db, user_id: int):
-    """
-    Отправляет напоминание конкретному пользователю
-    """
-    try:
-        # Получаем пользователя
-        user = await db.get(User, user_id)
-        if not user:
-            return
-        
-        # Получаем прогресс пользователя
-        progresses = await db.execute(
-            select(UserProgress)
-            .where(UserProgress.user_id == user_id)
-            .order_by(UserProgress.last_accessed.desc())
-        )
-        progresses = progresses.scalars().all()
-        
-        if not progresses:
-            return  # Нет незавершенных курсов
-        
-        # Берём последний активный курс
-        last_progress = progresses[0]
-        
-        # Здесь нужно получить название подкатегории из JSON
-        from utils.json_db import json_db
-        subcategory = json_db.get_subcategory(last_progress.subcategory_id)
-        
-        if not subcategory:
-            return
-        
-        # Формируем сообщение
-        text = (
-            f"👋 **Привет, {user.name}!**\n\n"
-            f"Вы остановились на курсе **{subcategory['name']}**.\n"
-            f"Урок: {last_progress.current_material_index + 1}\n\n"
-            f"Хотите продолжить обучение? Нажмите /start и выберите '📚 Курсы'!"
-        )
+            jobs = []
+            reminded = []
+            for tg_id, name, progress_id, subcategory_id, current_index in (await db.execute(query)).all():
+                subcategory_name = subcategory_names.get(subcategory_id)
+                if not subcategory_name:
+                    continue
+                text = (
+                    f"👋 **Привет, {name}!**\n\n"
+                    f"Вы остановились на курсе **{subcategory_name}**.\n"
+                    f"Урок: {current_index + 1}\n\n"
+                    f"Хотите продолжить обучение? Нажмите /start и выберите '📚 Курсы'!"
+                )
+                jobs.append((tg_id, partial(bot.send_message, tg_id, text, parse_mode="HTML")))
+                reminded.append(progress_id)
+            if not jobs:
+                continue
+            
+            # Отмечаем до отправки: повторный запуск в этот период простоя уже не напомнит
+            await db.execute(
+                update(UserProgress)
+                .where(UserProgress.id.in_(reminded))
+                .values(last_resume_at=datetime.utcnow())
+            )
+            await db.commit()
+            
+            batch_sent, batch_failed = await deliver(jobs)
+            sent += batch_sent
+            failed += batch_failed
         
-        await bot.send_message(user.tg_id, text, parse_mode="HTML")
-        logger.info(f"✅ Напоминание отправлено пользователю {user.tg_id}")
+        logger.info(f"✅ Напоминания отправлены: {sent} успешно, {failed} с ошибками")
         
     except Exception as e:
-        logger.error(f"❌ Ошибка при отправке напоминания пользователю {user_id}: {e}")
+        logger.error(f"❌ Ошибка в smart_resume: {e}")
 
 
 async def check_inactive_users(bot: Bot, db, days: int = 7):
     """
-    Проверяет неактивных пользователей и отправляет мотивационное сообщение
+    Проверяет неактивных пользователей и отправляет мотивационное сообщение.
+    Получатели читаются пачками по users.id
     """
     try:
-        cutoff_date = datetime.now() - timedelta(days=days)
-        
-        inactive_users = await db.execute(
-            select(User).where(User.last_active < cutoff_date)
-        )
-        inactive_users = inactive_users.scalars().all()
+        cutoff_date = datetime.utcnow() - timedelta(days=days)
+        sent = failed = 0
+        last_id = 0
         
-        for user in inactive_users:
-            try:
+        while True:
+            inactive_users = await db.execute(
+                select(User.id, User.tg_id, User.name)
+                .where(User.last_active < cutoff_date, User.id > last_id)
+                .order_by(User.id)
+                .limit(NOTIFY_BATCH_SIZE)
+            )
+            inactive_users = inactive_users.all()
+            if not inactive_users:
+                break
+            last_id = inactive_users[-1].id
+            
+            jobs = []
+            for _, tg_id, name in inactive_users:
                 text = (
                     f"👋 **Мы скучаем!**\n\n"
-                    f"Привет, {user.name}! Вы давно не заходили в бота.\n"
+                    f"Привет, {name}! Вы давно не заходили в бота.\n"
                     f"Новые курсы уже ждут вас! Заходите продолжить обучение 🚀"
                 )
-                await bot.send_message(user.tg_id, text, parse_mode="HTML")
-                logger.info(f"✅ Мотивационное сообщение отправлено {user.tg_id}")
-                
-            except Exception as e:
-                logger.error(f"❌ Ошибка отправки {user.tg_id}: {e}")
+                jobs.append((tg_id, partial(bot.send_message, tg_id, text, parse_mode="HTML")))
+            
+            batch_sent, batch_failed = await deliver(jobs)
+            sent += batch_sent
+            failed += batch_failed
+        
+        logger.info(f"✅ Мотивационные сообщения отправлены: {sent} успешно, {failed} с ошибками")
                 
     except Exception as e:
         logger.error(f"❌ Ошибка в check_inactive_users: {e}")
@@ -147,47 +278,57 @@ async def check_inactive_users(bot: Bot, db, days: int = 7):
 
 async def send_weekly_stats(bot: Bot, db):
     """
-    Отправляет еженедельную статистику активным пользователям
+    Отправляет еженедельную статистику активным пользователям.
+    Получатели читаются пачками по users.id, уроки за неделю для пачки
+    считаются одним сгруппированным запросом
     """
     try:
-        week_ago = datetime.now() - timedelta(days=7)
+        week_ago = datetime.utcnow() - timedelta(days=7)
+        sent = failed = 0
+        last_id = 0
         
-        active_users = await db.execute(
-            select(User).where(User.last_active >= week_ago)
-        )
-        active_users = active_users.scalars().all()
-        
-        for user in active_users:
-            try:
-                # Получаем прогресс за неделю
-                progresses = await db.execute(
-                    select(UserProgress)
-                    .where(
-                        UserProgress.user_id == user.id,
-                        UserProgress.last_accessed >= week_ago
-                    )
+        while True:
+            active_users = await db.execute(
+                select(User.id, User.tg_id, User.name, User.level, User.xp)
+                .where(User.last_active >= week_ago, User.id > last_id)
+                .order_by(User.id)
+                .limit(NOTIFY_BATCH_SIZE)
+            )
+            active_users = active_users.all()
+            if not active_users:
+                break
+            last_id = active_users[-1].id
+            
+            lessons = await db.execute(
+                select(
+                    UserProgress.user_id,
+                    func.sum(func.coalesce(func.json_array_length(UserProgress.completed_materials), 0))
                 )
-                progresses = progresses.scalars().all()
-                
-                lessons_done = 0
-                for p in progresses:
-                    if p.completed_materials:
-                        lessons_done += len(p.completed_materials)
-                
+                .where(
+                    UserProgress.user_id.in_([row.id for row in active_users]),
+                    UserProgress.last_accessed >= week_ago
+                )
+                .group_by(UserProgress.user_id)
+            )
+            lessons = dict(lessons.all())
+            
+            jobs = []
+            for user_id, tg_id, name, level, xp in active_users:
                 text = (
                     f"📊 **Ваша статистика за неделю**\n\n"
-                    f"👤 {user.name}\n"
-                    f"📚 Изучено уроков: {lessons_done}\n"
-                    f"📈 Текущий уровень: {user.level}\n"
-                    f"⭐ Всего XP: {user.xp}\n\n"
+                    f"👤 {name}\n"
+                    f"📚 Изучено уроков: {lessons.get(user_id) or 0}\n"
+                    f"📈 Текущий уровень: {level}\n"
+                    f"⭐ Всего XP: {xp}\n\n"
                     f"Так держать! 🚀"
                 )
-                
-                await bot.send_message(user.tg_id, text, parse_mode="HTML")
-                logger.info(f"✅ Статистика отправлена {user.tg_id}")
-                
-            except Exception as e:
-                logger.error(f"❌ Ошибка отправки статистики {user.tg_id}: {e}")
+                jobs.append((tg_id, partial(bot.send_message, tg_id, text, parse_mode="HTML")))
+            
+            batch_sent, batch_failed = await deliver(jobs)
+            sent += batch_sent
+            failed += batch_failed
+        
+        logger.info(f"✅ Недельная статистика отправлена: {sent} успешно, {failed} с ошибками")
                 
     except Exception as e:
-        logger.error(f"❌ Ошибка в send_weekly_stats: {e}")
\ No newline at end of file
+        logger.error(f"❌ Ошибка в send_weekly_stats: {e}")
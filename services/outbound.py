@@ -0,0 +1,195 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Общий лимит запросов к Bot API в секунду (на процесс) и лимит на один чат
+OUTBOUND_RATE_PER_SECOND = float(os.getenv("OUTBOUND_RATE_PER_SECOND", "30"))
+OUTBOUND_CHAT_RATE_PER_SECOND = float(os.getenv("OUTBOUND_CHAT_RATE_PER_SECOND", "1"))
+# Сколько запросов в один чат можно отправить подряд без ожидания (ответ + уведомление)
+OUTBOUND_CHAT_BURST = int(os.getenv("OUTBOUND_CHAT_BURST", "3"))
+OUTBOUND_MAX_RETRIES = 3
+# Методы, которые не ограничиваются: long polling и служебные вызовы при запуске
+UNLIMITED_METHODS = frozenset({"getUpdates", "getMe", "setWebhook", "deleteWebhook", "getWebhookInfo"})
+# Лимит на один чат нужен только методам, которые пишут в чат. Чтение (getChatMember,
+# getChat) и ответы на колбэки идут в общий лимит: иначе проверка подписки всех
+# пользователей упиралась бы в один лимит канала спонсора
+CHAT_LIMITED_PREFIXES = ("send", "copy", "forward", "edit")
+_MAX_TRACKED_CHATS = 10000
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+# Приоритет запросов текущей задачи; массовые рассылки помечают себя через bulk_priority()
+_priority: ContextVar[int] = ContextVar("outbound_priority", default=PRIORITY_INTERACTIVE)
+
+
+@contextmanager
+def bulk_priority():
+    """Запросы внутри блока (и в созданных в нём задачах) уступают ответам пользователям"""
+    token = _priority.set(PRIORITY_BULK)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class Throttle:
+    """
+    Ограничение частоты по алгоритму GCRA: не чаще rate в секунду
+    с допуском burst запросов подряд. Резервирование не требует блокировок
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.tolerance = self.interval * (max(1, burst) - 1)
+        self.tat = 0.0  # теоретическое время следующего запроса
+
+    def reserve(self) -> float:
+        """Резервирует место и возвращает, сколько секунд подождать"""
+        if not self.interval:
+            return 0.0
+        now = time.monotonic()
+        tat = max(self.tat, now)
+        self.tat = tat + self.interval
+        return max(0.0, tat - self.tolerance - now)
+
+    def penalize(self, seconds: float):
+        """Сдвигает ближайший разрешённый запрос (после флуд-контроля)"""
+        self.tat = max(self.tat, time.monotonic() + seconds)
+
+    def idle(self) -> bool:
+        return self.tat <= time.monotonic()
+
+
+class OutboundLimiter:
+    """
+    Планировщик исходящих запросов: сначала лимит чата, затем общая очередь
+    с приоритетами. Общий лимит раздаётся по одному запросу, и ответы
+    пользователям всегда идут раньше ожидающих массовых отправок
+    """
+
+    def __init__(
+        self,
+        rate: float = OUTBOUND_RATE_PER_SECOND,
+        chat_rate: float = OUTBOUND_CHAT_RATE_PER_SECOND,
+        chat_burst: int = OUTBOUND_CHAT_BURST
+    ):
+        self.throttle = Throttle(rate, burst=max(1, int(rate)))
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self._chats: Dict[Any, Throttle] = {}
+        self._queue = []  # (приоритет, порядковый номер, future)
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._pump_task = None
+
+    def _chat(self, chat_id) -> Throttle:
+        throttle = self._chats.get(chat_id)
+        if throttle is None:
+            if len(self._chats) >= _MAX_TRACKED_CHATS:
+                self._chats = {key: t for key, t in self._chats.items() if not t.idle()}
+            throttle = self._chats[chat_id] = Throttle(self.chat_rate, self.chat_burst)
+        return throttle
+
+    async def acquire(self, chat_id=None, priority: int = PRIORITY_INTERACTIVE):
+        if chat_id is not None:
+            delay = self._chat(chat_id).reserve()
+            if delay:
+                await asyncio.sleep(delay)
+
+        if self._pump_task is None or self._pump_task.done():
+            self._wakeup = asyncio.Event()
+            self._pump_task = asyncio.create_task(self._pump())
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._seq), future))
+        self._wakeup.set()
+        await future
+
+    def penalize(self, chat_id, seconds: float):
+        if chat_id is None:
+            self.throttle.penalize(seconds)
+        else:
+            self._chat(chat_id).penalize(seconds)
+
+    async def close(self):
+        """Останавливает раздачу мест (при закрытии сессии бота)"""
+        task, self._pump_task = self._pump_task, None
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        for _, _, future in self._queue:
+            future.cancel()
+        self._queue.clear()
+
+    async def _pump(self):
+        while True:
+            while not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+
+            delay = self.throttle.reserve()
+            if delay:
+                await asyncio.sleep(delay)
+
+            # Место в общем лимите получает самый приоритетный из ожидающих на этот момент
+            while self._queue:
+                _, _, future = heapq.heappop(self._queue)
+                if not future.done():
+                    future.set_result(None)
+                    break
+
+
+class RateLimitedSession(AiohttpSession):
+    """
+    Сессия бота, через которую проходят все исходящие запросы:
+    общий и початовый лимиты, приоритет ответов над рассылками
+    и повтор после флуд-контроля (429) с нарастающей паузой
+    """
+
+    def __init__(self, limiter: OutboundLimiter = None, max_retries: int = OUTBOUND_MAX_RETRIES, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.limiter = limiter or OutboundLimiter()
+        self.max_retries = max_retries
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: int = None):
+        if method.__api_method__ in UNLIMITED_METHODS:
+            return await super().make_request(bot, method, timeout)
+
+        chat_id = getattr(method, "chat_id", None) if method.__api_method__.startswith(CHAT_LIMITED_PREFIXES) else None
+        priority = _priority.get()
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire(chat_id, priority)
+            try:
+                return await super().make_request(bot, method, timeout)
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                self.limiter.penalize(chat_id, e.retry_after)
+                backoff = e.retry_after + 0.5 * 2 ** attempt
+                logger.warning(f"⏳ Флуд-контроль на {method.__api_method__} ({chat_id}), повтор через {backoff:g} с")
+                await asyncio.sleep(backoff)
+
+    async def close(self):
+        # create_session() тоже вызывает close() перед пересозданием соединения -
+        # очередь запросов в этот момент останавливать нельзя
+        if not self._should_reset_connector:
+            await self.limiter.close()
+        await super().close()
@@ -0,0 +1,194 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+from aiogram import Bot
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from sqlalchemy.engine import make_url
+from config import Config
+from database import AsyncSessionLocal
+from services.leader import LeaderLock
+from services.activity import activity_tracker, rollup_activity
+from services.broadcast import resume_broadcasts
+from services.notifications import (
+    send_daily_tip,
+    smart_resume,
+    check_inactive_users,
+    send_weekly_stats,
+    DAILY_TIP_SLOT_MINUTES
+)
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# memory - задачи в памяти процесса; persistent - в БД, выполняет только лидер
+SCHEDULER_MODE = os.getenv("SCHEDULER_MODE", "memory")
+# Синхронный URL для хранилища задач (по умолчанию выводится из DATABASE_URL)
+SCHEDULER_DB_URL = os.getenv("SCHEDULER_DB_URL")
+SCHEDULER_MISFIRE_GRACE_SECONDS = int(os.getenv("SCHEDULER_MISFIRE_GRACE_SECONDS", "600"))
+LEADER_HEARTBEAT_SECONDS = int(os.getenv("LEADER_HEARTBEAT_SECONDS", "15"))
+
+# Бот, от имени которого задачи планировщика отправляют сообщения
+_bot: Bot = None
+_lock = LeaderLock("scheduler")
+_leader_task = None
+
+
+async def daily_tip_job():
+    """Очередной тик рассылки ежедневных советов"""
+    async with AsyncSessionLocal() as db:
+        await send_daily_tip(_bot, db)
+
+
+async def smart_resume_job():
+    """Напоминания о брошенных курсах"""
+    async with AsyncSessionLocal() as db:
+        await smart_resume(_bot, db)
+
+
+async def inactive_users_job():
+    """Мотивационные сообщения неактивным пользователям"""
+    async with AsyncSessionLocal() as db:
+        await check_inactive_users(_bot, db)
+
+
+async def weekly_stats_job():
+    """Еженедельная статистика"""
+    async with AsyncSessionLocal() as db:
+        await send_weekly_stats(_bot, db)
+
+
+async def activity_rollup_job():
+    """Свёртка активности за вчера (окончательная) и за сегодня (текущая)"""
+    await activity_tracker.flush()
+    today = datetime.utcnow().date()
+    async with AsyncSessionLocal() as db:
+        for day in (today - timedelta(days=1), today):
+            await rollup_activity(db, day)
+
+
+async def broadcast_resume_job():
+    """Подхватывает рассылки, брошенные упавшими процессами (аренда истекла)"""
+    await resume_broadcasts(_bot)
+
+
+def _jobstore_url() -> str:
+    """Синхронный URL той же БД для SQLAlchemyJobStore"""
+    if SCHEDULER_DB_URL:
+        return SCHEDULER_DB_URL
+    url = make_url(Config.DATABASE_URL)
+    # postgresql+asyncpg -> postgresql (psycopg2), sqlite+aiosqlite -> sqlite
+    return url.set(drivername=url.get_backend_name()).render_as_string(hide_password=False)
+
+
+def _check_jobstore_driver(url: str):
+    """Понятная ошибка вместо ImportError из глубины SQLAlchemy"""
+    try:
+        make_url(url).get_dialect().import_dbapi()
+    except ImportError as e:
+        raise RuntimeError(
+            f"SCHEDULER_MODE=persistent: нет синхронного драйвера БД для {make_url(url).drivername} ({e}). "
+            "Для PostgreSQL установите psycopg2-binary или задайте SCHEDULER_DB_URL"
+        ) from e
+
+
+def setup_scheduler(bot: Bot) -> AsyncIOScheduler:
+    """Создаёт планировщик (задачи регистрирует register_jobs)"""
+    global _bot
+    _bot = bot
+
+    if SCHEDULER_MODE == "persistent":
+        url = _jobstore_url()
+        _check_jobstore_driver(url)
+        return AsyncIOScheduler(
+            jobstores={"default": SQLAlchemyJobStore(url=url, tablename="apscheduler_jobs")},
+            job_defaults={"coalesce": True, "misfire_grace_time": SCHEDULER_MISFIRE_GRACE_SECONDS}
+        )
+    return AsyncIOScheduler()
+
+
+def register_jobs(scheduler: AsyncIOScheduler):
+    """
+    Добавляет периодические задачи, которых ещё нет в хранилище.
+    Сохранённые задачи не перезаписываются: иначе при смене лидера
+    next_run_time пересчитывается и пропущенные запуски теряются
+    """
+    jobs = [
+        # Советы рассылаются шардами в течение окна, а не одной пачкой в 9:00.
+        # Тик может затянуться дольше шага - разрешаем несколько экземпляров подряд
+        # (получатели отмечаются до отправки, поэтому тики не пересекаются)
+        (daily_tip_job, dict(trigger='cron', minute=f"*/{DAILY_TIP_SLOT_MINUTES}", id="daily_tip", max_instances=3)),
+        (smart_resume_job, dict(trigger='cron', hour=19, minute=0, id="smart_resume")),  # Каждый день в 19:00
+        (inactive_users_job, dict(trigger='cron', day_of_week='mon', hour=12, minute=0, id="inactive_users")),
+        (activity_rollup_job, dict(trigger='cron', minute=5, id="activity_rollup")),  # Каждый час
+        (weekly_stats_job, dict(trigger='cron', day_of_week='sun', hour=18, minute=0, id="weekly_stats")),
+        (broadcast_resume_job, dict(trigger='cron', minute="*/5", id="broadcast_resume")),  # Каждые 5 минут
+    ]
+    for func, options in jobs:
+        if scheduler.get_job(options["id"]) is None:
+            scheduler.add_job(func, coalesce=True, **options)
+
+
+async def start_scheduler(bot: Bot, on_leader: Callable[[], Awaitable] = None) -> AsyncIOScheduler:
+    """
+    Запускает планировщик.
+    В режиме memory задачи выполняются в этом процессе сразу.
+    В режиме persistent задачи хранятся в БД, а выполняет их только
+    реплика-лидер; остальные ждут и подхватывают лидерство при её падении.
+    on_leader вызывается, когда процесс становится лидером
+    """
+    global _leader_task
+    scheduler = setup_scheduler(bot)
+
+    if SCHEDULER_MODE != "persistent":
+        register_jobs(scheduler)
+        scheduler.start()
+        if on_leader:
+            await on_leader()
+        return scheduler
+
+    scheduler.start(paused=True)
+    _leader_task = asyncio.create_task(_lead(scheduler, on_leader))
+    return scheduler
+
+
+async def stop_scheduler(scheduler: AsyncIOScheduler):
+    """Останавливает планировщик и отдаёт лидерство"""
+    if _leader_task is not None:
+        _leader_task.cancel()
+    if scheduler.running:
+        scheduler.shutdown(wait=False)
+    await _lock.release()
+
+
+async def _lead(scheduler: AsyncIOScheduler, on_leader):
+    is_leader = False
+    while True:
+        try:
+            ok = await (_lock.refresh() if is_leader else _lock.acquire())
+        except Exception as e:
+            logger.error(f"Ошибка выбора лидера планировщика: {e}")
+            ok = False
+
+        if ok and not is_leader:
+            try:
+                logger.info("👑 Процесс стал лидером планировщика")
+                register_jobs(scheduler)
+                scheduler.resume()
+                is_leader = True
+                if on_leader:
+                    await on_leader()
+            except Exception as e:
+                # Не держим лидерство с полузапущенными задачами - пусть попробует другая реплика
+                logger.error(f"❌ Ошибка при получении лидерства планировщика: {e}")
+                is_leader = False
+                scheduler.pause()
+                await _lock.release()
+        elif not ok and is_leader:
+            is_leader = False
+            logger.warning("⚠️ Лидерство планировщика потеряно, задачи приостановлены")
+            scheduler.pause()
+
+        await asyncio.sleep(LEADER_HEARTBEAT_SECONDS)
@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import select, func
+from database import AsyncSessionLocal
+from models import User, Sponsor, Broadcast, ActivityRollup
+from services.activity import database_totals
+from utils.json_db import json_db
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Как часто фоновая задача пересчитывает снимок из БД и файлов
+STATS_REFRESH_SECONDS = float(os.getenv("STATS_REFRESH_SECONDS", "300"))
+
+
+class StatsSnapshot:
+    """Готовые цифры для публичных экранов"""
+
+    def __init__(self, categories: int = 0, subcategories: int = 0, materials: int = 0, users: int = 0):
+        self.categories = categories
+        self.subcategories = subcategories
+        self.materials = materials
+        self.users = users
+        self.updated_at = datetime.utcnow()
+
+
+class BotStats:
+    """
+    Снимок статистики бота в памяти процесса.
+    Полностью пересчитывается фоновой задачей раз в STATS_REFRESH_SECONDS,
+    а между пересчётами обновляется точечно: регистрация увеличивает
+    число пользователей, запись каталога - пересчитывает счётчики контента
+    """
+
+    def __init__(self):
+        self._snapshot = StatsSnapshot()
+        self._content_version = None
+        self._task = None
+
+    @property
+    def snapshot(self) -> StatsSnapshot:
+        """Текущий снимок; обращения к БД нет, файлы читаются только после записи каталога"""
+        if self._content_version != json_db.content_version:
+            self._refresh_content()
+        return self._snapshot
+
+    def user_registered(self):
+        self._snapshot.users += 1
+
+    def _refresh_content(self):
+        self._content_version = json_db.content_version
+        index = json_db.get_content_index()
+        self._snapshot.categories = len(index.categories)
+        self._snapshot.subcategories = len(index.subcategories)
+        self._snapshot.materials = len(index.materials)
+
+    async def refresh(self):
+        """Полный пересчёт снимка"""
+        try:
+            async with AsyncSessionLocal() as db:
+                users = await db.execute(select(func.count(User.id)))
+                users = users.scalar() or 0
+            # Каталог мог измениться другим процессом - проверяем файлы заново
+            self._content_version = None
+            self._refresh_content()
+            self._snapshot.users = users
+            self._snapshot.updated_at = datetime.utcnow()
+        except Exception as e:
+            logger.error(f"❌ Ошибка обновления статистики: {e}")
+
+    async def start(self):
+        """Строит первый снимок и запускает периодическое обновление"""
+        await self.refresh()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(STATS_REFRESH_SECONDS)
+            await self.refresh()
+
+
+async def collect_admin_stats(db, now: datetime = None) -> dict:
+    """
+    Статистика для админ-панели: все показатели из БД одним запросом
+    (скалярные подзапросы), счётчики контента - из индекса в памяти.
+    "Сегодня" и "неделя" - диапазоны по last_active, которые используют индекс.
+    Итоги по всей базе (всего пользователей, средний XP, ученики, закладки)
+    берутся из последней почасовой свёртки activity_rollups, а не считаются
+    полным проходом при каждом открытии экрана
+    """
+    now = now or datetime.utcnow()
+    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    week_ago = now - timedelta(days=7)
+
+    latest = (
+        select(ActivityRollup)
+        .where(ActivityRollup.total_users.isnot(None))
+        .order_by(ActivityRollup.day.desc())
+        .limit(1)
+        .subquery()
+    )
+    row = await db.execute(
+        select(
+            select(latest.c.total_users).scalar_subquery().label("users"),
+            select(func.count(User.id)).where(User.last_active >= today_start).scalar_subquery().label("today_users"),
+            select(func.count(User.id)).where(User.last_active >= week_ago).scalar_subquery().label("week_users"),
+            select(latest.c.avg_xp).scalar_subquery().label("avg_xp"),
+            select(latest.c.active_learners).scalar_subquery().label("active_learners"),
+            select(latest.c.bookmarks).scalar_subquery().label("bookmarks"),
+            select(func.count(Sponsor.id)).scalar_subquery().label("sponsors"),
+            select(func.count(Broadcast.id)).scalar_subquery().label("broadcasts"),
+        )
+    )
+    stats = dict(row.one()._mapping)
+    if stats["users"] is None:
+        # Свёрток ещё не было (первый запуск) - считаем итоги один раз напрямую
+        totals = (await db.execute(select(*database_totals()))).one()
+        stats.update(users=totals.total_users, avg_xp=totals.avg_xp,
+                     active_learners=totals.active_learners, bookmarks=totals.bookmarks)
+    stats = {key: value or 0 for key, value in stats.items()}
+
+    index = json_db.get_content_index()
+    category_ids = {c['id'] for c in index.categories}
+    stats["categories"] = len(index.categories)
+    stats["subcategories"] = sum(1 for s in index.subcategories.values() if s['category_id'] in category_ids)
+    stats["materials"] = len(index.materials)
+    return stats
+
+
+bot_stats = BotStats()
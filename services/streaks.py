@@ -0,0 +1,30 @@
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
+from models import User
+from utils.helpers import get_user_timezone
+
+
+def update_streak(user: User, now: Optional[datetime] = None) -> Optional[Tuple[int, int]]:
+    """
+    Учитывает день обучения в серии пользователя за O(1), без истории прогресса.
+    День считается по местному времени пользователя.
+    Возвращает (предыдущая серия, новая серия), если серия изменилась, иначе None.
+    Изменения только в объекте user - сохраняет вызывающий код
+    """
+    now = now or datetime.now(timezone.utc)
+    today = now.astimezone(get_user_timezone(user.timezone)).date()
+    last_day = user.last_active_day
+
+    if last_day is not None and last_day >= today:
+        return None  # Сегодня уже учитывали
+
+    if last_day is not None and last_day == today - timedelta(days=1):
+        previous = user.current_streak or 0
+    else:
+        previous = 0  # Серия прервалась - начинаем заново
+    current = previous + 1
+
+    user.current_streak = current
+    user.longest_streak = max(user.longest_streak or 0, current)
+    user.last_active_day = today
+    return previous, current
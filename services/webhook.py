@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import os
+import signal
+from typing import Any, Dict
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Публичный адрес, на который Telegram шлёт апдейты (https://example.com)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+# Telegram передаёт его в X-Telegram-Bot-Api-Secret-Token; чужие запросы получают 401
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or None
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+# Сколько апдейтов обрабатывается одновременно и сколько может ждать очереди.
+# Сверх лимита очереди отвечаем 429 - Telegram доставит апдейт повторно позже
+WEBHOOK_MAX_CONCURRENCY = int(os.getenv("WEBHOOK_MAX_CONCURRENCY", "100"))
+WEBHOOK_MAX_PENDING = int(os.getenv("WEBHOOK_MAX_PENDING", "1000"))
+# Параллельных соединений со стороны Telegram (1-100)
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+# Сколько секунд при остановке ждать уже принятые апдейты
+WEBHOOK_DRAIN_SECONDS = float(os.getenv("WEBHOOK_DRAIN_SECONDS", "30"))
+
+
+class UpdateSlot:
+    """
+    Слот обработки одного апдейта в семафоре вебхука. Занимается на всё
+    время обработки; release/acquire позволяют временно вернуть его,
+    пока апдейт ждёт, и занять снова (повторный acquire ничего не делает)
+    """
+
+    def __init__(self, semaphore: asyncio.Semaphore):
+        self._semaphore = semaphore
+        self._held = False
+
+    async def acquire(self) -> None:
+        if not self._held:
+            await self._semaphore.acquire()
+            self._held = True
+
+    def release(self) -> None:
+        if self._held:
+            self._held = False
+            self._semaphore.release()
+
+    async def __aenter__(self) -> "UpdateSlot":
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.release()
+
+
+class LimitedRequestHandler(SimpleRequestHandler):
+    """
+    Обработчик вебхука: сразу отвечает Telegram, а апдейт обрабатывает
+    в фоне не более чем в max_concurrency задачах одновременно - слот
+    занимает сама фоновая задача. Слот передаётся в данных апдейта
+    (update_slot): ThrottlingMiddleware отдаёт его на время ожидания
+    очереди пользователя, поэтому такие апдейты слотов не расходуют.
+    При остановке дожидается принятых апдейтов, чтобы они не потерялись
+    """
+
+    def __init__(
+        self,
+        dispatcher: Dispatcher,
+        bot: Bot,
+        max_concurrency: int = WEBHOOK_MAX_CONCURRENCY,
+        max_pending: int = WEBHOOK_MAX_PENDING,
+        **kwargs: Any
+    ):
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        super().__init__(dispatcher, bot, handle_in_background=True, **kwargs)
+        self.max_pending = max_pending
+        self._closing = False
+
+    async def _background_feed_update(self, bot: Bot, update: Dict[str, Any]) -> None:
+        try:
+            async with UpdateSlot(self._semaphore) as slot:
+                result = await self.dispatcher.feed_raw_update(bot=bot, update=update, update_slot=slot, **self.data)
+                if isinstance(result, TelegramMethod):
+                    await self.dispatcher.silent_call_request(bot=bot, result=result)
+        except Exception as e:
+            logger.error(f"❌ Ошибка обработки апдейта {update.get('update_id')}: {e}")
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self._closing or len(self._background_feed_update_tasks) >= self.max_pending:
+            return web.Response(status=429 if not self._closing else 503)
+        return await super().handle(request)
+
+    async def drain(self, timeout: float = WEBHOOK_DRAIN_SECONDS):
+        """Перестаёт принимать апдейты и ждёт уже принятые"""
+        self._closing = True
+        pending = set(self._background_feed_update_tasks)
+        if not pending:
+            return
+        logger.info(f"⏳ Дожидаемся обработки {len(pending)} апдейтов")
+        done, not_done = await asyncio.wait(pending, timeout=timeout)
+        if not_done:
+            logger.warning(f"⚠️ Не дождались {len(not_done)} апдейтов за {timeout:g} с")
+
+    async def close(self) -> None:
+        # Сессию бота закрывает on_shutdown бота - здесь только дожидаемся апдейтов
+        await self.drain()
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher, drop_pending_updates: bool = False):
+    """Запускает aiohttp-сервер вебхука и работает до SIGINT/SIGTERM"""
+    if not WEBHOOK_URL:
+        raise RuntimeError("Для режима webhook задайте WEBHOOK_URL")
+
+    app = web.Application()
+    handler = LimitedRequestHandler(dp, bot, secret_token=WEBHOOK_SECRET)
+    # Сначала дожидаемся апдейтов (on_shutdown обработчика), потом останавливаем бота
+    handler.register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT)
+    await site.start()
+
+    # Вебхук не удаляется при остановке: пока идёт деплой, Telegram копит апдейты
+    await bot.set_webhook(
+        WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET,
+        drop_pending_updates=drop_pending_updates,
+        allowed_updates=dp.resolve_used_update_types(),
+        max_connections=WEBHOOK_MAX_CONNECTIONS
+    )
+    logger.info(f"🌐 Вебхук слушает {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows: остановка через KeyboardInterrupt
+            pass
+
+    try:
+        await stop.wait()
+    finally:
+        await runner.cleanup()
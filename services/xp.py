@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import os
+import time
+from bisect import bisect_right
+from datetime import datetime
+from sqlalchemy import select, update, insert, case, func
+from database import AsyncSessionLocal
+from models import User, XPEvent
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+XP_PER_LESSON = 10
+XP_PER_COURSE = 50
+XP_FLUSH_SECONDS = float(os.getenv("XP_FLUSH_SECONDS", "5"))
+MAX_LEVEL = 100
+LEADERBOARD_SIZE = 10
+# Как часто перечитывать топ из БД: опыт начисляют и другие процессы (воркеры, реплики)
+LEADERBOARD_TTL_SECONDS = float(os.getenv("LEADERBOARD_TTL_SECONDS", "60"))
+
+# Порог опыта для каждого уровня: уровень n начинается с 50 * n * (n - 1) XP
+LEVEL_THRESHOLDS = [50 * n * (n - 1) for n in range(1, MAX_LEVEL + 1)]
+
+
+def level_for_xp(xp: int) -> int:
+    """Уровень по количеству опыта (бинарный поиск по таблице порогов)"""
+    return max(1, bisect_right(LEVEL_THRESHOLDS, xp or 0))
+
+
+class Leaderboard:
+    """
+    Топ пользователей по XP в памяти процесса.
+    Опыт только растёт, поэтому после каждого сброса достаточно
+    слить изменённых пользователей с текущим топом и обрезать его.
+    Начисления других процессов видны после перечитывания из БД
+    (раз в LEADERBOARD_TTL_SECONDS, по индексу users.xp)
+    """
+
+    def __init__(self, size: int = LEADERBOARD_SIZE, ttl: float = LEADERBOARD_TTL_SECONDS):
+        self.size = size
+        self.ttl = ttl
+        self._entries = None  # user_id -> {"name", "xp", "level"}
+        self._loaded_at = 0.0
+
+    async def load(self, db):
+        result = await db.execute(
+            select(User.id, User.name, User.xp, User.level).order_by(User.xp.desc()).limit(self.size)
+        )
+        self._entries = {
+            user_id: {"name": name, "xp": xp or 0, "level": level or 1}
+            for user_id, name, xp, level in result.all()
+        }
+        self._loaded_at = time.monotonic()
+
+    def apply(self, rows):
+        """Учитывает строки (id, name, xp, level) пользователей с новым опытом"""
+        if self._entries is None:
+            return
+        for user_id, name, xp, level in rows:
+            self._entries[user_id] = {"name": name, "xp": xp, "level": level}
+        if len(self._entries) > self.size:
+            top = sorted(self._entries.items(), key=lambda item: item[1]["xp"], reverse=True)[:self.size]
+            self._entries = dict(top)
+
+    async def top(self, db):
+        """Список записей топа по убыванию XP"""
+        if self._entries is None or time.monotonic() - self._loaded_at >= self.ttl:
+            await self.load(db)
+        return sorted(self._entries.values(), key=lambda entry: entry["xp"], reverse=True)
+
+
+class XPLedger:
+    """
+    Начисление опыта без UPDATE строки users на каждое нажатие:
+    события, суммы опыта и число пройденных уроков копятся в памяти
+    и раз в XP_FLUSH_SECONDS записываются пачкой (INSERT событий + один UPDATE)
+    """
+
+    def __init__(self):
+        self._pending = {}  # user_id -> сумма XP
+        self._lessons = {}  # user_id -> пройдено уроков (users.lessons_completed)
+        self._events = []
+        self._task = None
+        self._lock = asyncio.Lock()
+        self.leaderboard = Leaderboard()
+
+    def award(self, user_id: int, amount: int, reason: str, lessons: int = 0):
+        """Начислить опыт и учесть пройденные уроки (запишется при ближайшем сбросе)"""
+        if lessons > 0:
+            self._lessons[user_id] = self._lessons.get(user_id, 0) + lessons
+        if amount <= 0:
+            return
+        self._pending[user_id] = self._pending.get(user_id, 0) + amount
+        self._events.append({
+            "user_id": user_id,
+            "amount": amount,
+            "reason": reason,
+            "created_at": datetime.utcnow()
+        })
+
+    async def flush(self):
+        """Записывает накопленный опыт в БД"""
+        async with self._lock:
+            if not self._pending and not self._lessons:
+                return
+            pending, self._pending = self._pending, {}
+            lessons, self._lessons = self._lessons, {}
+            events, self._events = self._events, []
+
+            values = {}
+            if pending:
+                values["xp"] = func.coalesce(User.xp, 0) + case(pending, value=User.id, else_=0)
+            if lessons:
+                values["lessons_completed"] = (
+                    func.coalesce(User.lessons_completed, 0) + case(lessons, value=User.id, else_=0)
+                )
+
+            try:
+                async with AsyncSessionLocal() as db:
+                    if events:
+                        await db.execute(insert(XPEvent), events)
+
+                    result = await db.execute(
+                        update(User)
+                        .where(User.id.in_(pending.keys() | lessons.keys()))
+                        .values(**values)
+                        .returning(User.id, User.name, User.xp, User.level)
+                    )
+                    rows = result.all()
+
+                    levels = {}
+                    for user_id, _, xp, level in rows:
+                        new_level = level_for_xp(xp)
+                        if new_level != level:
+                            levels[user_id] = new_level
+                    if levels:
+                        await db.execute(
+                            update(User)
+                            .where(User.id.in_(levels.keys()))
+                            .values(level=case(levels, value=User.id))
+                        )
+                    await db.commit()
+
+                self.leaderboard.apply(
+                    (user_id, name, xp, levels.get(user_id, level)) for user_id, name, xp, level in rows
+                )
+            except Exception as e:
+                logger.error(f"❌ Ошибка записи опыта: {e}")
+                # Возвращаем несохранённое в буфер до следующей попытки
+                for user_id, amount in pending.items():
+                    self._pending[user_id] = self._pending.get(user_id, 0) + amount
+                for user_id, count in lessons.items():
+                    self._lessons[user_id] = self._lessons.get(user_id, 0) + count
+                self._events = events + self._events
+
+    def start(self):
+        """Запускает периодический сброс"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Останавливает сброс и записывает остаток"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(XP_FLUSH_SECONDS)
+            await self.flush()
+
+
+xp_ledger = XPLedger()
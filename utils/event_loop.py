@@ -0,0 +1,35 @@
+import asyncio
+import logging
+import os
+import sys
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# auto - uvloop, если установлен (кроме Windows); uvloop - только он; asyncio - стандартный цикл
+EVENT_LOOP = os.getenv("EVENT_LOOP", "auto")
+
+
+def setup_event_loop(kind: str = EVENT_LOOP) -> str:
+    """
+    Выбирает политику цикла событий под платформу и возвращает её название.
+    Windows: SelectorEventLoop (Proactor не поддерживает часть сетевых функций aiohttp/asyncpg).
+    Linux/macOS: uvloop, иначе стандартный цикл (epoll/kqueue выбирается сам)
+    """
+    if sys.platform == "win32":
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+        return "selector"
+
+    if kind in ("auto", "uvloop"):
+        try:
+            import uvloop
+        except ImportError:
+            if kind == "uvloop":
+                raise
+            logger.info("uvloop не установлен - используется стандартный цикл asyncio")
+        else:
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+            return "uvloop"
+
+    asyncio.set_event_loop_policy(asyncio.DefaultEventLoopPolicy())
+    return "asyncio"
@@ -0,0 +1,140 @@
+import os
+import time
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy import select
+
+from database import AsyncSessionLocal, dialect_insert
+from models import FSMRecord
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# memory - состояния в памяти процесса; sql - таблица fsm_states; redis - REDIS_URL
+FSM_STORAGE = os.getenv("FSM_STORAGE", "memory")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Локальный кэш чтения перед sql/redis: число ключей и время жизни записи.
+# Состояние пользователя меняет в основном один процесс, а TTL ограничивает
+# устаревание, если апдейт пришёл в другую реплику
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", "10000"))
+FSM_CACHE_TTL_SECONDS = float(os.getenv("FSM_CACHE_TTL_SECONDS", "30"))
+
+_MISSING = object()
+
+
+def _state_name(state: StateType) -> Optional[str]:
+    return state.state if isinstance(state, State) else state
+
+
+class SQLStorage(BaseStorage):
+    """FSM-хранилище в таблице fsm_states той же БД, что и у бота"""
+
+    def __init__(self):
+        self.key_builder = DefaultKeyBuilder(with_destiny=True)
+
+    async def _upsert(self, key: StorageKey, values: Dict[str, Any]):
+        stmt = dialect_insert(FSMRecord).values(key=self.key_builder.build(key), **values)
+        stmt = stmt.on_conflict_do_update(index_elements=["key"], set_=values)
+        async with AsyncSessionLocal() as db:
+            await db.execute(stmt)
+            await db.commit()
+
+    async def _get(self, key: StorageKey, column):
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(select(column).where(FSMRecord.key == self.key_builder.build(key)))
+            return result.scalar_one_or_none()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self._upsert(key, {"state": _state_name(state)})
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return await self._get(key, FSMRecord.state)
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        await self._upsert(key, {"data": dict(data)})
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return dict(await self._get(key, FSMRecord.data) or {})
+
+    async def close(self) -> None:
+        pass
+
+
+class CachedStorage(BaseStorage):
+    """
+    LRU-кэш чтения поверх другого хранилища.
+    Запись идёт сразу в хранилище и в кэш (write-through), чтение -
+    из кэша, пока запись не старше ttl секунд
+    """
+
+    def __init__(self, storage: BaseStorage, size: int = FSM_CACHE_SIZE, ttl: float = FSM_CACHE_TTL_SECONDS):
+        self.storage = storage
+        self.size = size
+        self.ttl = ttl
+        self._cache: "OrderedDict[StorageKey, list]" = OrderedDict()  # ключ -> [истекает, состояние, данные]
+
+    def _entry(self, key: StorageKey) -> list:
+        entry = self._cache.get(key)
+        now = time.monotonic()
+        if entry is None or entry[0] <= now:
+            entry = [now + self.ttl, _MISSING, _MISSING]
+            self._cache[key] = entry
+            if len(self._cache) > self.size:
+                self._cache.popitem(last=False)
+        self._cache.move_to_end(key)
+        return entry
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self.storage.set_state(key, state)
+        self._entry(key)[1] = _state_name(state)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        entry = self._entry(key)
+        if entry[1] is _MISSING:
+            entry[1] = await self.storage.get_state(key)
+        return entry[1]
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        await self.storage.set_data(key, data)
+        self._entry(key)[2] = dict(data)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        entry = self._entry(key)
+        if entry[2] is _MISSING:
+            entry[2] = await self.storage.get_data(key)
+        # Копия - чтобы изменения словаря в хендлере не попадали в кэш
+        return dict(entry[2])
+
+    async def close(self) -> None:
+        self._cache.clear()
+        await self.storage.close()
+
+
+def create_storage(kind: str = FSM_STORAGE) -> BaseStorage:
+    """Хранилище FSM по настройке FSM_STORAGE"""
+    if kind == "redis":
+        # redis нужен только для этого режима и не входит в обязательные зависимости
+        try:
+            from aiogram.fsm.storage.redis import RedisStorage
+        except ImportError:
+            raise RuntimeError("Для FSM_STORAGE=redis установите пакет redis: pip install redis==7.2.0")
+        backend = RedisStorage.from_url(
+            REDIS_URL,
+            key_builder=DefaultKeyBuilder(with_destiny=True),
+            state_ttl=None,
+            data_ttl=None
+        )
+    elif kind == "sql":
+        backend = SQLStorage()
+    else:
+        return MemoryStorage()
+
+    logger.info(f"🗄 FSM-хранилище: {kind} (кэш {FSM_CACHE_SIZE} ключей, TTL {FSM_CACHE_TTL_SECONDS:g} с)")
+    if FSM_CACHE_SIZE <= 0:
+        return backend
+    return CachedStorage(backend)
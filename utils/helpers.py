@@ -1,7 +1,15 @@
 import json
+import os
 import random
 import re
 from datetime import datetime
+from functools import lru_cache
+from math import gcd
+from typing import Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+# Часовой пояс для пользователей, которые свой не указали (по умолчанию - пояс сервера)
+DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE")
 
 def is_valid_url(url: str) -> bool:
     """
@@ -23,29 +31,66 @@ def is_valid_url(url: str) -> bool:
     )
     return bool(re.match(regex, url))
 
+DEFAULT_TIPS = (
+    "🧠 Учитесь понемногу, но каждый день! 15 минут в день эффективнее, чем 2 часа раз в неделю.",
+    "📝 Записывайте важные мысли - это улучшает запоминание.",
+    "🎯 Ставьте конкретные цели на каждый день.",
+    "💪 Повторение - мать учения! Повторяйте пройденный материал через день.",
+    "🌙 Хороший сон улучшает память и способность к обучению.",
+    "🚶‍♂️ Делайте перерывы каждые 25-30 минут.",
+    "🤔 Объясняйте материал другим - это помогает понять лучше.",
+    "📚 Используйте разные источники информации.",
+    "⚡ Практикуйтесь как можно больше.",
+    "🌟 Отдых так же важен, как и учеба.",
+    "🎓 Знания, которые не применяются, забываются. Применяйте сразу!",
+    "🔍 Ищите связи между разными темами - это помогает понять картину целиком.",
+    "💡 Задавайте вопросы. Любопытство - двигатель прогресса.",
+    "📅 Планируйте своё время. Регулярность важнее интенсивности.",
+    "🏆 Отмечайте свои успехи, даже маленькие."
+)
+
 def get_random_tip() -> str:
     """
     Возвращает случайный совет для ежедневной мотивации
     """
-    tips = [
-        "🧠 Учитесь понемногу, но каждый день! 15 минут в день эффективнее, чем 2 часа раз в неделю.",
-        "📝 Записывайте важные мысли - это улучшает запоминание.",
-        "🎯 Ставьте конкретные цели на каждый день.",
-        "💪 Повторение - мать учения! Повторяйте пройденный материал через день.",
-        "🌙 Хороший сон улучшает память и способность к обучению.",
-        "🚶‍♂️ Делайте перерывы каждые 25-30 минут.",
-        "🤔 Объясняйте материал другим - это помогает понять лучше.",
-        "📚 Используйте разные источники информации.",
-        "⚡ Практикуйтесь как можно больше.",
-        "🌟 Отдых так же важен, как и учеба.",
-        "🎓 Знания, которые не применяются, забываются. Применяйте сразу!",
-        "🔍 Ищите связи между разными темами - это помогает понять картину целиком.",
-        "💡 Задавайте вопросы. Любопытство - двигатель прогресса.",
-        "📅 Планируйте своё время. Регулярность важнее интенсивности.",
-        "🏆 Отмечайте свои успехи, даже маленькие."
-    ]
-    import random
-    return random.choice(tips)
+    return random.choice(DEFAULT_TIPS)
+
+@lru_cache(maxsize=32)
+def _coprimes(size: int) -> tuple:
+    """Множители, дающие перестановку по модулю size"""
+    return tuple(k for k in range(1, size + 1) if gcd(k, size) == 1)
+
+def tip_rotation_index(user_id: int, offset: int, size: int) -> int:
+    """
+    Индекс совета для пользователя в его личной перестановке пула.
+    Перестановка задаётся (user_id, номер круга) и вычисляется за O(1)
+    как a*i + b по модулю size, поэтому хранить нужно только смещение.
+    Пока пул не пройден целиком, советы не повторяются
+    """
+    cycle, position = divmod(offset, size)
+    seed = (user_id * 2654435761 + cycle * 40503) & 0xFFFFFFFF
+    multipliers = _coprimes(size)
+    a = multipliers[seed % len(multipliers)]
+    b = (seed >> 8) % size
+    return (a * position + b) % size
+
+def get_tip_for_user(pool, user_id: int, offset: int) -> str:
+    """Следующий совет из пула для пользователя с текущим смещением offset"""
+    pool = pool or DEFAULT_TIPS
+    return pool[tip_rotation_index(user_id, offset or 0, len(pool))]
+
+def get_user_timezone(tz_name: Optional[str] = None):
+    """
+    Часовой пояс пользователя; если не указан или неизвестен - пояс по умолчанию
+    """
+    if tz_name:
+        try:
+            return ZoneInfo(tz_name)
+        except (ZoneInfoNotFoundError, ValueError):
+            pass
+    if DEFAULT_TIMEZONE:
+        return ZoneInfo(DEFAULT_TIMEZONE)
+    return datetime.now().astimezone().tzinfo
 
 def format_profile(user) -> str:
     return f"""
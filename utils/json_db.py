@@ -10,6 +10,45 @@ logger = logging.getLogger(__name__)
 
 DATA_DIR = "data"
 BACKUP_DIR = "data/backups"
+CONTENT_FILES = ("categories.json", "subcategories.json", "materials.json")
+
+class ContentIndex:
+    """
+    Снимок каталога в памяти: словари по ID, отсортированные уроки
+    и количество уроков по подкатегориям. Строится один раз на версию файлов
+    """
+    
+    def __init__(self, categories: List[Dict], subcategories: List[Dict], materials: List[Dict]):
+        self.categories = categories
+        self.subcategories = {s['id']: s for s in subcategories}
+        self.materials = {m['id']: m for m in materials}
+        
+        by_subcategory = {}
+        for m in materials:
+            by_subcategory.setdefault(m['subcategory_id'], []).append(m)
+        self.materials_by_subcategory = {
+            sub_id: sorted(items, key=lambda x: x['order_num'])
+            for sub_id, items in by_subcategory.items()
+        }
+        self.lesson_counts = {sub_id: len(items) for sub_id, items in self.materials_by_subcategory.items()}
+        # Позиция урока внутри своей подкатегории
+        self.material_positions = {
+            m['id']: i
+            for items in self.materials_by_subcategory.values()
+            for i, m in enumerate(items)
+        }
+    
+    def lesson_count(self, subcategory_id: int) -> int:
+        return self.lesson_counts.get(subcategory_id, 0)
+    
+    def get_lessons(self, subcategory_id: int) -> List[Dict]:
+        """Уроки подкатегории в порядке order_num"""
+        return self.materials_by_subcategory.get(subcategory_id, [])
+    
+    def subcategory_name(self, subcategory_id: int, default: Optional[str] = None) -> Optional[str]:
+        sub = self.subcategories.get(subcategory_id)
+        return sub['name'] if sub else default
+
 
 class JSONDB:
     def __init__(self):
@@ -21,6 +60,13 @@ class JSONDB:
         self._ensure_file_exists("materials.json", [])
         self._ensure_file_exists("faq.json", [])
         self._ensure_file_exists("tips.json", [])
+        
+        # (mtime файла, кортеж советов) - пул перечитывается только при изменении tips.json
+        self._tip_pool = None
+        # (mtime файлов каталога, ContentIndex)
+        self._content_index = None
+        # Растёт при каждой записи каталога этим процессом
+        self.content_version = 0
     
     def _ensure_file_exists(self, filename: str, default_data: list):
         """Создает файл с дефолтными данными, если его нет"""
@@ -57,12 +103,36 @@ class JSONDB:
             
             with open(filepath, 'w', encoding='utf-8') as f:
                 json.dump(data, f, ensure_ascii=False, indent=2)
+            if filename in CONTENT_FILES:
+                self._content_index = None
+                self.content_version += 1
             return True
         except Exception as e:
             logger.error(f"Ошибка записи {filename}: {e}")
             return False
     
 
+    def _mtime(self, filename: str):
+        try:
+            return os.stat(os.path.join(DATA_DIR, filename)).st_mtime_ns
+        except OSError:
+            return None
+    
+    def get_content_index(self) -> ContentIndex:
+        """
+        Индекс каталога в памяти. Перестраивается, только если изменился
+        один из файлов (в том числе записью из другого процесса)
+        """
+        version = tuple(self._mtime(f) for f in CONTENT_FILES)
+        if self._content_index is None or self._content_index[0] != version:
+            index = ContentIndex(
+                self._read_file("categories.json"),
+                self._read_file("subcategories.json"),
+                self._read_file("materials.json")
+            )
+            self._content_index = (version, index)
+        return self._content_index[1]
+    
     def get_categories(self) -> List[Dict]:
         """Получить все категории"""
         return self._read_file("categories.json")
@@ -286,13 +356,29 @@ class JSONDB:
         self._write_file("faq.json", faqs)
         return True
     
+    def get_achievement_rules(self) -> List[Dict]:
+        """Получить правила достижений"""
+        return self._read_file("achievements.json")
+    
     def get_tips(self) -> List[str]:
         """Получить все советы"""
         return self._read_file("tips.json")
     
+    def get_tip_pool(self) -> tuple:
+        """Получить закэшированный пул советов"""
+        filepath = os.path.join(DATA_DIR, "tips.json")
+        try:
+            mtime = os.stat(filepath).st_mtime_ns
+        except OSError:
+            mtime = None
+        
+        if self._tip_pool is None or self._tip_pool[0] != mtime:
+            self._tip_pool = (mtime, tuple(self.get_tips()))
+        return self._tip_pool[1]
+    
     def get_random_tip(self) -> str:
         """Получить случайный совет"""
-        tips = self.get_tips()
+        tips = self.get_tip_pool()
         if not tips:
             return "💡 Учитесь каждый день!"
         import random
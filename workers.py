@@ -0,0 +1,219 @@
+"""
+Многопроцессный запуск бота: один процесс принимает апдейты (polling или
+webhook) и раскладывает их по WORKERS процессам-обработчикам по id
+пользователя. Апдейты одного пользователя всегда попадают в один процесс
+и обрабатываются там по порядку, поэтому и MemoryStorage для FSM остаётся
+корректным.
+
+    WORKERS=4 python workers.py
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+from typing import Any, Dict, Optional
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+WORKERS = int(os.getenv("WORKERS", "0")) or os.cpu_count() or 1
+# Сколько апдейтов может ждать в очереди одного процесса
+WORKER_QUEUE_SIZE = int(os.getenv("WORKER_QUEUE_SIZE", "1000"))
+POLLING_TIMEOUT = 30
+
+
+def update_user_id(update: Dict[str, Any]) -> Optional[int]:
+    """id пользователя (или чата), от которого пришёл апдейт"""
+    for key, payload in update.items():
+        if key == "update_id" or not isinstance(payload, dict):
+            continue
+        for field in ("from", "user", "chat"):
+            if isinstance(payload.get(field), dict) and "id" in payload[field]:
+                return payload[field]["id"]
+        message = payload.get("message")
+        if isinstance(message, dict) and isinstance(message.get("chat"), dict):
+            return message["chat"]["id"]
+    return None
+
+
+def shard_for(update: Dict[str, Any], workers: int) -> int:
+    user_id = update_user_id(update)
+    return (user_id if user_id is not None else update["update_id"]) % workers
+
+
+# ---------- ОБРАБОТЧИК ----------
+
+def worker_main(index: int, updates: "multiprocessing.Queue", workers: int = 1):
+    """Точка входа процесса-обработчика"""
+    # Ctrl+C получает вся группа процессов; останавливает обработчиков приёмник
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Общий лимит Bot API делится между процессами поровну
+    total_rate = float(os.getenv("OUTBOUND_RATE_PER_SECOND", "30"))
+    os.environ["OUTBOUND_RATE_PER_SECOND"] = str(total_rate / workers)
+    import main as bot_app  # настраивает цикл событий и собирает Dispatcher
+
+    asyncio.run(_work(bot_app, index, updates))
+
+
+async def _work(bot_app, index: int, updates):
+    from utils.json_db import json_db
+
+    # Снимки каталога и советов строятся один раз на процесс
+    json_db.get_content_index()
+    json_db.get_tip_pool()
+    # Планировщик (и продолжение рассылок) - только в первом процессе
+    await bot_app.start_services(run_scheduler=index == 0)
+    logger.info(f"⚙️ Обработчик {index} запущен (pid {os.getpid()})")
+
+    loop = asyncio.get_running_loop()
+    user_locks: Dict[int, list] = {}  # id пользователя -> [Lock, сколько апдейтов его ждут]
+    tasks = set()
+
+    async def process(update: Dict[str, Any]):
+        # Lock в asyncio отдаётся в порядке очереди - апдейты пользователя идут по порядку
+        user_id = update_user_id(update)
+        entry = user_locks.setdefault(user_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await bot_app.dp.feed_raw_update(bot_app.bot, update)
+        except Exception as e:
+            logger.error(f"❌ Обработчик {index}: ошибка апдейта {update.get('update_id')}: {e}")
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del user_locks[user_id]
+
+    while True:
+        update = await loop.run_in_executor(None, updates.get)
+        if update is None:
+            break
+        task = asyncio.create_task(process(update))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    if tasks:
+        await asyncio.wait(tasks)
+    await bot_app.on_shutdown()
+    logger.info(f"🛑 Обработчик {index} остановлен")
+
+
+# ---------- ПРИЁМНИК ----------
+
+class Router:
+    """Раскладывает апдейты по очередям обработчиков"""
+
+    def __init__(self, queues):
+        self.queues = queues
+
+    def put_nowait(self, update: Dict[str, Any]) -> bool:
+        try:
+            self.queues[shard_for(update, len(self.queues))].put_nowait(update)
+            return True
+        except queue.Full:
+            return False
+
+    async def put(self, update: Dict[str, Any]):
+        # Очередь полна - ждём в пуле потоков, не блокируя цикл (естественный backpressure)
+        target = self.queues[shard_for(update, len(self.queues))]
+        await asyncio.get_running_loop().run_in_executor(None, target.put, update)
+
+
+async def _poll(bot, dp, router: Router, stop: asyncio.Event, drop_pending_updates: bool):
+    await bot.delete_webhook(drop_pending_updates=drop_pending_updates)
+    allowed_updates = dp.resolve_used_update_types()
+    offset = None
+    while not stop.is_set():
+        try:
+            batch = await bot.get_updates(offset=offset, timeout=POLLING_TIMEOUT, allowed_updates=allowed_updates)
+        except Exception as e:
+            logger.error(f"Ошибка получения апдейтов: {e}")
+            await asyncio.sleep(1)
+            continue
+        for update in batch:
+            await router.put(update.model_dump(mode="json", exclude_none=True, by_alias=True))
+            offset = update.update_id + 1
+
+
+async def _serve_webhook(bot, dp, router: Router, stop: asyncio.Event, drop_pending_updates: bool):
+    import secrets
+    from aiohttp import web
+    from services.webhook import (
+        WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_MAX_CONNECTIONS
+    )
+
+    async def handle(request: web.Request) -> web.Response:
+        token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if WEBHOOK_SECRET and not secrets.compare_digest(token, WEBHOOK_SECRET):
+            return web.Response(body="Unauthorized", status=401)
+        # Очередь обработчика переполнена - Telegram повторит апдейт позже
+        if not router.put_nowait(await request.json()):
+            return web.Response(status=429)
+        return web.json_response({})
+
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+    await bot.set_webhook(
+        WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET,
+        drop_pending_updates=drop_pending_updates,
+        allowed_updates=dp.resolve_used_update_types(),
+        max_connections=WEBHOOK_MAX_CONNECTIONS
+    )
+    logger.info(f"🌐 Приёмник вебхука слушает {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+    try:
+        await stop.wait()
+    finally:
+        await runner.cleanup()
+
+
+async def receive(workers: int = WORKERS):
+    import main as bot_app
+
+    # Таблицы создаются один раз здесь, а не параллельно в каждом обработчике
+    await bot_app.prepare_database()
+    await bot_app.engine.dispose()
+
+    context = multiprocessing.get_context("spawn")
+    queues = [context.Queue(maxsize=WORKER_QUEUE_SIZE) for _ in range(workers)]
+    processes = [
+        context.Process(target=worker_main, args=(i, q, workers), name=f"bot-worker-{i}", daemon=False)
+        for i, q in enumerate(queues)
+    ]
+    for process in processes:
+        process.start()
+    logger.info(f"🚀 Запущено обработчиков: {workers}, режим приёма: {bot_app.BOT_MODE}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    receiver = _serve_webhook if bot_app.BOT_MODE == "webhook" else _poll
+    task = asyncio.create_task(receiver(bot_app.bot, bot_app.dp, Router(queues), stop, bot_app.DROP_PENDING_UPDATES))
+    try:
+        await stop.wait()
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        # Обработчики доделывают свою очередь и останавливаются
+        for q in queues:
+            await loop.run_in_executor(None, q.put, None)
+        for process in processes:
+            await loop.run_in_executor(None, process.join)
+        await bot_app.bot.session.close()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(receive())
+    except KeyboardInterrupt:
+        print("👋 Бот остановлен пользователем")